@@ -0,0 +1,73 @@
+# benchmarks/bench_read_models.py
+#
+# Compares full-document Beanie loads with projection models and the raw-Motor
+# fast path for the hot reads (balance, history page, webhook lookup).
+#
+# Usage (needs the usual .env for src.config, and a scratch MongoDB):
+#   BENCH_MONGO_URI=mongodb://localhost:27017/pp_bench python -m benchmarks.bench_read_models
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import motor.motor_asyncio
+from beanie import init_beanie
+
+from src.models.generation import Generation, GenerationHistoryView, GenerationRef
+from src.models.user import User, UserBalanceView
+from src.services.fast_reads import get_user_credits
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "500"))
+CHAT_ID = 1000
+
+
+async def seed():
+    await User.delete_all()
+    await Generation.delete_all()
+    await User(chat_id=CHAT_ID, username="bench", first_name="b", last_name="b").insert()
+    now = datetime.utcnow()
+    await Generation.insert_many([
+        Generation(
+            chat_id=CHAT_ID, photo_file_id="x" * 80, status="done", model_name="black-forest-labs/flux-kontext-pro",
+            product_name=f"product {i}", summary="توضیحات " * 7, result_url="https://replicate.delivery/out.png",
+            replicate_id=f"rep{i}", created_at=now - timedelta(minutes=i),
+        )
+        for i in range(200)
+    ])
+
+
+async def timed(label: str, fn):
+    await fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await fn()
+    per_call = (time.perf_counter() - start) / ROUNDS * 1e6
+    print(f"{label:<45} {per_call:10.1f} µs/op")
+
+
+async def main():
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017/pp_bench"))
+    await init_beanie(database=client.get_default_database(), document_models=[User, Generation])
+    await seed()
+
+    print(f"{ROUNDS} rounds each\n")
+    await timed("balance: full User document", lambda: User.find_one(User.chat_id == CHAT_ID))
+    await timed("balance: UserBalanceView projection",
+                lambda: User.find_one(User.chat_id == CHAT_ID, projection_model=UserBalanceView))
+    await timed("balance: raw Motor", lambda: get_user_credits(CHAT_ID))
+
+    def history(projection_model=None):
+        return lambda: Generation.find(
+            Generation.chat_id == CHAT_ID, projection_model=projection_model
+        ).sort(-Generation.created_at).limit(6).to_list()
+    await timed("history page: full Generation documents", history())
+    await timed("history page: GenerationHistoryView", history(GenerationHistoryView))
+
+    await timed("webhook lookup: full Generation document", lambda: Generation.find_one(Generation.replicate_id == "rep42"))
+    await timed("webhook lookup: GenerationRef projection",
+                lambda: Generation.find_one(Generation.replicate_id == "rep42", projection_model=GenerationRef))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
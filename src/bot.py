@@ -8,6 +8,6 @@ bot = AsyncTeleBot(settings.BOT_TOKEN, state_storage=StateMemoryStorage())
 
 # Register handler modules
 import src.handlers.commands
+import src.handlers.admin
 import src.handlers.messages
-import src.handlers.callbacks
-# import src.handlers.admin 
\ No newline at end of file
+import src.handlers.callbacks 
\ No newline at end of file
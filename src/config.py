@@ -7,7 +7,7 @@ class Settings(BaseSettings):
     TAPSAGE_API_KEY: str = Field(..., env="TAPSAGE_API_KEY")
     TAPSAGE_BOT_ID: str = Field(..., env="TAPSAGE_BOT_ID")
     REPLICATE_API_TOKEN: str = Field(..., env="REPLICATE_API_TOKEN")
-    REPLICATE_CALLBACK_URL: str = Field(..., env="REPLICATE_CALLBACK_URL")
+    REPLICATE_CALLBACK_URL: str = Field(default="", env="REPLICATE_CALLBACK_URL")  # empty = poll instead
     ZARINPAL_MERCHANT_ID: str = Field(..., env="ZARINPAL_MERCHANT_ID")
     ZARINPAL_CALLBACK_URL: str = Field(..., env="ZARINPAL_CALLBACK_URL")
     ZARINPAL_REQUEST_URL: str = Field(..., env="ZARINPAL_REQUEST_URL")
@@ -15,12 +15,81 @@ class Settings(BaseSettings):
     ZARINPAL_PAYMENT_BASE: str = Field(..., env="ZARINPAL_PAYMENT_BASE")
     PIXY_API_KEY: str = Field(..., env="PIXY_API_KEY")
     LOGFIRE_TOKEN: str = Field(..., env="LOGFIRE_TOKEN")
+    MONGO_MAX_POOL_SIZE: int = Field(default=100, env="MONGO_MAX_POOL_SIZE")
+    MONGO_MIN_POOL_SIZE: int = Field(default=0, env="MONGO_MIN_POOL_SIZE")
+    MONGO_MAX_IDLE_TIME_MS: int = Field(default=300_000, env="MONGO_MAX_IDLE_TIME_MS")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = Field(default=10_000, env="MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    MONGO_CONNECT_TIMEOUT_MS: int = Field(default=5_000, env="MONGO_CONNECT_TIMEOUT_MS")
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = Field(default=10_000, env="MONGO_SERVER_SELECTION_TIMEOUT_MS")
+    MONGO_SOCKET_TIMEOUT_MS: int = Field(default=60_000, env="MONGO_SOCKET_TIMEOUT_MS")
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    MONGO_COMPRESSORS: str = Field(default="zlib", env="MONGO_COMPRESSORS")
+    MONGO_MAX_STALENESS_SECONDS: int = Field(default=90, env="MONGO_MAX_STALENESS_SECONDS")  # 90 is the driver minimum
+    MONGO_MAJORITY_WTIMEOUT_MS: int = Field(default=5_000, env="MONGO_MAJORITY_WTIMEOUT_MS")
     ZARINPAL_MERCHANT_MOBILE: str = Field(..., env="ZARINPAL_MERCHANT_MOBILE")
     ZARINPAL_MERCHANT_EMAIL: str = Field(..., env="ZARINPAL_MERCHANT_EMAIL")
     REFERRAL_REWARD_COINS: int = Field(default=1, env="REFERRAL_REWARD_COINS")
     NEW_USER_GIFT_COINS: int = Field(default=1, env="NEW_USER_GIFT_COINS")
     MANDATORY_CHANNEL_ID: str = Field(default="@PhotosazAI", env="MANDATORY_CHANNEL_ID")
     ADMIN_CHAT_IDS: list[int] = Field(default=[791927771], env="ADMIN_CHAT_IDS")
+    LEDGER_RECONCILE_INTERVAL_SECONDS: int = Field(default=3600, env="LEDGER_RECONCILE_INTERVAL_SECONDS")
+    INPUT_TARGET_RESOLUTION: int = Field(default=1024, env="INPUT_TARGET_RESOLUTION")
+    INPUT_MAX_BYTES: int = Field(default=1_500_000, env="INPUT_MAX_BYTES")
+    INPUT_MAX_DIMENSION: int = Field(default=10_000, env="INPUT_MAX_DIMENSION")
+    INPUT_MIN_DIMENSION: int = Field(default=256, env="INPUT_MIN_DIMENSION")
+    IMAGE_WORKERS: int = Field(default=2, env="IMAGE_WORKERS")
+    RESULT_PREVIEW_FORMAT: str = Field(default="JPEG", env="RESULT_PREVIEW_FORMAT")
+    RESULT_PREVIEW_QUALITY: int = Field(default=92, env="RESULT_PREVIEW_QUALITY")
+    RESULT_PREVIEW_MAX_SIDE: int = Field(default=2048, env="RESULT_PREVIEW_MAX_SIDE")
+    QUEUE_CONCURRENCY: int = Field(default=4, env="QUEUE_CONCURRENCY")
+    QUEUE_POLL_INTERVAL_SECONDS: float = Field(default=2.0, env="QUEUE_POLL_INTERVAL_SECONDS")
+    LEASE_SECONDS: int = Field(default=60, env="LEASE_SECONDS")
+    PROCESSING_LEASE_SECONDS: int = Field(default=600, env="PROCESSING_LEASE_SECONDS")
+    REPLICATE_SYNC_WAIT_SECONDS: int = Field(default=0, ge=0, le=60, env="REPLICATE_SYNC_WAIT_SECONDS")  # 0 = off
+    REPLICATE_POLL_SECONDS: int = Field(default=15, env="REPLICATE_POLL_SECONDS")
+    PROGRESS_EDIT_INTERVAL_SECONDS: float = Field(default=3.0, env="PROGRESS_EDIT_INTERVAL_SECONDS")
+    MAX_GENERATION_ATTEMPTS: int = Field(default=3, env="MAX_GENERATION_ATTEMPTS")
+    REHOST_STORAGE: str = Field(default="pixy", env="REHOST_STORAGE")  # 'pixy' or 'tapsage'
+    REHOST_CONCURRENCY: int = Field(default=3, env="REHOST_CONCURRENCY")
+    REHOST_MAX_ATTEMPTS: int = Field(default=5, env="REHOST_MAX_ATTEMPTS")
+    REHOST_POLL_INTERVAL_SECONDS: float = Field(default=10.0, env="REHOST_POLL_INTERVAL_SECONDS")
+    REPLICATE_OUTPUT_TTL_SECONDS: int = Field(default=3600, env="REPLICATE_OUTPUT_TTL_SECONDS")  # Replicate deletes outputs after 1h
+    MODEL_SLOW_SECONDS: float = Field(default=90.0, env="MODEL_SLOW_SECONDS")
+    MODEL_MAX_FAILURE_RATE: float = Field(default=0.3, env="MODEL_MAX_FAILURE_RATE")
+    MODEL_PROFILE_WINDOW_MINUTES: int = Field(default=30, env="MODEL_PROFILE_WINDOW_MINUTES")
+    MODEL_PROFILE_MIN_SAMPLES: int = Field(default=5, env="MODEL_PROFILE_MIN_SAMPLES")
+    MODEL_PROFILE_TTL_SECONDS: float = Field(default=30.0, env="MODEL_PROFILE_TTL_SECONDS")
+    MODEL_MAX_SUBMIT_FAILURES: int = Field(default=3, env="MODEL_MAX_SUBMIT_FAILURES")
+    CIRCUIT_FAILURE_THRESHOLD: int = Field(default=5, env="CIRCUIT_FAILURE_THRESHOLD")
+    CIRCUIT_RESET_SECONDS: float = Field(default=30.0, env="CIRCUIT_RESET_SECONDS")
+    RETRY_BUDGET_RATIO: float = Field(default=0.2, env="RETRY_BUDGET_RATIO")
+    RETRY_BUDGET_BURST: float = Field(default=10.0, env="RETRY_BUDGET_BURST")
+    RESULT_CACHE_ENABLED: bool = Field(default=False, env="RESULT_CACHE_ENABLED")
+    RESULT_CACHE_TTL_DAYS: int = Field(default=30, env="RESULT_CACHE_TTL_DAYS")
+    RESULT_CACHE_HIT_COST_RATIO: float = Field(default=0.5, env="RESULT_CACHE_HIT_COST_RATIO")
+    RESULT_CACHE_PHASH_DISTANCE: int = Field(default=4, env="RESULT_CACHE_PHASH_DISTANCE")
+    DRAFT_GENERATION_TTL_HOURS: int = Field(default=24, env="DRAFT_GENERATION_TTL_HOURS")
+    ARCHIVE_AFTER_DAYS: int = Field(default=90, env="ARCHIVE_AFTER_DAYS")
+    ARCHIVE_BATCH_SIZE: int = Field(default=500, env="ARCHIVE_BATCH_SIZE")
+    ARCHIVE_INTERVAL_SECONDS: int = Field(default=3600, env="ARCHIVE_INTERVAL_SECONDS")
+    CALLBACK_PAYLOAD_TTL_DAYS: int = Field(default=30, env="CALLBACK_PAYLOAD_TTL_DAYS")
+    GENERATION_METRICS_TTL_DAYS: int = Field(default=365, env="GENERATION_METRICS_TTL_DAYS")
+    ADMISSION_ENABLED: bool = Field(default=True, env="ADMISSION_ENABLED")
+    # Per tier; 0 disables a check. Paid users are only stopped by a real meltdown by default.
+    ADMISSION_MAX_QUEUE_FREE: int = Field(default=30, env="ADMISSION_MAX_QUEUE_FREE")
+    ADMISSION_MAX_WAIT_SECONDS_FREE: float = Field(default=900.0, env="ADMISSION_MAX_WAIT_SECONDS_FREE")
+    ADMISSION_MAX_LATENCY_SECONDS_FREE: float = Field(default=180.0, env="ADMISSION_MAX_LATENCY_SECONDS_FREE")
+    ADMISSION_MAX_QUEUE_PAID: int = Field(default=0, env="ADMISSION_MAX_QUEUE_PAID")
+    ADMISSION_MAX_WAIT_SECONDS_PAID: float = Field(default=0.0, env="ADMISSION_MAX_WAIT_SECONDS_PAID")
+    ADMISSION_MAX_LATENCY_SECONDS_PAID: float = Field(default=0.0, env="ADMISSION_MAX_LATENCY_SECONDS_PAID")
+    ADMISSION_CACHE_SECONDS: float = Field(default=5.0, env="ADMISSION_CACHE_SECONDS")
+    RATE_LIMIT_ENABLED: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
+    RATE_LIMIT_BACKEND: str = Field(default="mongo", env="RATE_LIMIT_BACKEND")  # 'mongo' (shared) or 'memory'
+    # JSON overrides, e.g. {"photo": {"free": [5, 2]}} = burst of 5, 2 per minute
+    RATE_LIMITS: dict[str, dict[str, list[float]]] = Field(default_factory=dict, env="RATE_LIMITS")
+    RATE_LIMIT_TIER_CACHE_SECONDS: float = Field(default=60.0, env="RATE_LIMIT_TIER_CACHE_SECONDS")
+    RATE_LIMIT_BUCKET_TTL_SECONDS: int = Field(default=86400, env="RATE_LIMIT_BUCKET_TTL_SECONDS")
+    QUEUE_DEFAULT_SERVICE_SECONDS: float = Field(default=60.0, env="QUEUE_DEFAULT_SERVICE_SECONDS")
 
     class Config:
         env_file = ".env"
@@ -1,15 +1,129 @@
+import logfire
 import motor.motor_asyncio
-from beanie import init_beanie
+from beanie import Document, init_beanie
+from pymongo import WriteConcern, monitoring
+from pymongo.read_preferences import SecondaryPreferred
 from src.config import settings
 from src.models.user import User
-from src.models.generation import Generation
+from src.models.generation import Generation, ArchivedGeneration
 from src.models.payment import Payment
 from src.models.app_config import AppConfig
+from src.models.credit_ledger import CreditLedgerEntry
+from src.models.result_cache import ResultCacheEntry
+from src.models.daily_stats import DailyStats
+from src.models.generation_payload import GenerationPayload, ArchivedGenerationPayload
+from src.models.referral import Referral
+from src.models.callback_payload import CallbackPayload
+from src.models.rate_limit import RateLimitBucket
+from src.models.generation_metric import GenerationMetric
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool activity across all servers, for the admin /dbpool command.
+    The driver calls these from its own threads; plain counters are fine for monitoring.
+    """
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.cleared = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+            "open": self.open,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "avg_wait_ms": self.wait_ms_total / self.checkouts if self.checkouts else 0.0,
+            "max_wait_ms": self.wait_ms_max,
+            "cleared": self.cleared,
+        }
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+        wait_ms = event.duration * 1000
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+        logfire.warn(f"⚠️ Mongo connection checkout failed: {event.reason}")
+
+    def pool_cleared(self, event):
+        self.cleared += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_metrics = PoolMetrics()
+
+# History and analytics tolerate slightly stale data, so they read from secondaries when there are any
+_SECONDARY_PREFERRED = SecondaryPreferred(max_staleness=settings.MONGO_MAX_STALENESS_SECONDS)
+
+
+def secondary_reads(model: type[Document]) -> motor.motor_asyncio.AsyncIOMotorCollection:
+    """
+    The model's collection with a secondary-preferred read preference.
+    """
+    return model.get_motor_collection().with_options(read_preference=_SECONDARY_PREFERRED)
+
+
+def majority_writes(model: type[Document]) -> motor.motor_asyncio.AsyncIOMotorCollection:
+    """
+    The model's collection with a majority write concern, for money movements that
+    must survive a primary failover. Everything else keeps the cheaper default.
+    """
+    return model.get_motor_collection().with_options(
+        write_concern=WriteConcern("majority", wtimeout=settings.MONGO_MAJORITY_WTIMEOUT_MS)
+    )
+
 
 async def init_db():
     """
     Establish MongoDB connection and initialize document models.
     """
-    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        settings.MONGO_URI,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+        compressors=settings.MONGO_COMPRESSORS or None,
+        event_listeners=[pool_metrics],
+    )
     db = client.get_default_database()
-    await init_beanie(database=db, document_models=[User, Generation, Payment, AppConfig])
+    await init_beanie(database=db, document_models=[User, Generation, Payment, AppConfig, CreditLedgerEntry, ResultCacheEntry, DailyStats, ArchivedGeneration, GenerationPayload, ArchivedGenerationPayload, Referral, CallbackPayload, RateLimitBucket, GenerationMetric])
@@ -0,0 +1,214 @@
+# src/handlers/admin.py
+
+import logging
+from uuid import UUID
+from telebot.types import Message
+
+from src.bot import bot
+from src.config import settings
+from src.database import pool_metrics
+from src.models.generation import ArchivedGeneration, Generation
+from src.models.user import User
+from src.services import analytics, credit_ledger, job_metrics, model_registry, queue_estimator, resilience
+from src.texts import messages
+
+logger = logging.getLogger("pp_bot.handlers.admin")
+
+
+def is_admin(message: Message) -> bool:
+    return message.chat.id in settings.ADMIN_CHAT_IDS
+
+
+@bot.message_handler(commands=["ledger"], func=is_admin)
+async def ledger_cmd(message: Message):
+    """
+    Shows a user's recent credit ledger entries next to their balance, for support questions.
+    """
+    try:
+        target_chat_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        return await bot.send_message(message.chat.id, messages.ADMIN_USAGE_LEDGER)
+
+    user = await User.find_one(User.chat_id == target_chat_id)
+    entries = await credit_ledger.get_recent_entries(target_chat_id)
+    if not entries:
+        return await bot.send_message(message.chat.id, messages.ADMIN_LEDGER_EMPTY)
+
+    total = await credit_ledger.get_ledger_total(target_chat_id)
+    lines = [messages.ADMIN_LEDGER_HEADER.format(
+        chat_id=target_chat_id, credits=user.credits if user else "-", ledger_total=total
+    )]
+    for entry in entries:
+        lines.append(messages.ADMIN_LEDGER_ENTRY.format(
+            date=entry.created_at.strftime("%Y-%m-%d %H:%M"), kind=entry.kind, amount=entry.amount, key=entry.key
+        ))
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+
+@bot.message_handler(commands=["trace"], func=is_admin)
+async def trace_cmd(message: Message):
+    """
+    Prints a generation's stage timeline with the gap before each stage, plus its trace
+    id for finding the full span tree in Logfire.
+    """
+    try:
+        uid = UUID(message.text.split()[1])
+    except (IndexError, ValueError):
+        return await bot.send_message(message.chat.id, messages.ADMIN_USAGE_TRACE)
+
+    gen = await Generation.find_one(Generation.uid == uid) or await ArchivedGeneration.find_one(ArchivedGeneration.uid == uid)
+    if not gen:
+        return await bot.send_message(message.chat.id, messages.ADMIN_TRACE_NOT_FOUND)
+
+    lines = [messages.ADMIN_TRACE_HEADER.format(
+        uid=gen.uid, chat_id=gen.chat_id, status=gen.status, model_name=gen.model_name,
+        attempts=gen.attempts, trace_id=gen.trace_id or "-",
+    )]
+    stages = sorted(
+        ((stage, gen.stage_times[stage]) for stage in job_metrics.STAGES if stage in gen.stage_times),
+        key=lambda item: item[1],
+    )
+    if stages:
+        start = previous = stages[0][1]
+        for stage, at in stages:
+            lines.append(messages.ADMIN_TRACE_STAGE.format(
+                stage=stage, time=at.strftime("%Y-%m-%d %H:%M:%S"),
+                since_previous=f"{(at - previous).total_seconds():.1f}",
+                since_start=f"{(at - start).total_seconds():.1f}",
+            ))
+            previous = at
+    if gen.usage:
+        lines.append(messages.ADMIN_TRACE_USAGE.format(
+            usage="، ".join(f"{key}={value:g}" for key, value in sorted(gen.usage.items()))
+        ))
+    if gen.error:
+        lines.append(messages.ADMIN_TRACE_ERROR.format(error=gen.error))
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+
+@bot.message_handler(commands=["reconcile"], func=is_admin)
+async def reconcile_cmd(message: Message):
+    """
+    Runs the ledger reconciliation on demand and lists mismatched balances.
+    """
+    mismatches = await credit_ledger.find_balance_mismatches(limit=30)
+    if not mismatches:
+        return await bot.send_message(message.chat.id, messages.ADMIN_RECONCILE_OK)
+
+    lines = [messages.ADMIN_RECONCILE_MISMATCHES.format(count=len(mismatches))]
+    lines += [messages.ADMIN_RECONCILE_ROW.format(**row) for row in mismatches]
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+
+@bot.message_handler(commands=["models"], func=is_admin)
+async def models_cmd(message: Message):
+    """
+    Lists the image model registry with each model's live latency/failure profile.
+    """
+    lines = []
+    for model in await model_registry.get_models():
+        profile = await model_registry.get_profile(model.name)
+        lines.append(messages.ADMIN_MODEL_ROW.format(
+            name=model.name,
+            in_flight=profile.in_flight,
+            max_concurrency=model.max_concurrency,
+            avg_seconds=f"{profile.avg_seconds:.1f}" if profile.avg_seconds is not None else "-",
+            failure_rate=f"{profile.failure_rate:.0%}",
+            samples=profile.samples,
+            submit_failures=profile.submit_failures,
+            state="⚠️" if profile.degraded else "✅",
+        ))
+    await bot.send_message(message.chat.id, "\n\n".join(lines))
+
+
+@bot.message_handler(commands=["capacity"], func=is_admin)
+async def capacity_cmd(message: Message):
+    """
+    Queue depth per tier next to the measured drain rate per tier and service, for capacity planning.
+    """
+    depths = await queue_estimator.queue_depths()
+    lines = [messages.ADMIN_CAPACITY_QUEUE.format(**depths)]
+    services = sorted({s for m in await model_registry.get_models() for s in m.services})
+    for tier in ("paid", "free"):
+        # Paid jobs are claimed first, so free jobs drain only after the paid queue
+        backlog = depths["paid"] + (depths["free"] if tier == "free" else 0)
+        for service in services:
+            capacity = await queue_estimator.capacity_for(tier, service)
+            drain = backlog * 60 / capacity.jobs_per_min if capacity.jobs_per_min else float("inf")
+            lines.append(messages.ADMIN_CAPACITY_ROW.format(
+                tier=tier, service=service, drain=queue_estimator.format_eta(drain), **capacity.model_dump()
+            ))
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+
+@bot.message_handler(commands=["dbpool"], func=is_admin)
+async def dbpool_cmd(message: Message):
+    """
+    MongoDB connection pool usage of this process, to size MONGO_MAX_POOL_SIZE.
+    """
+    await bot.send_message(message.chat.id, messages.ADMIN_DB_POOL.format(**pool_metrics.snapshot()))
+
+
+@bot.message_handler(commands=["breakers"], func=is_admin)
+async def breakers_cmd(message: Message):
+    """
+    Shows circuit breaker state and remaining retry budget per upstream (this process).
+    """
+    icons = {"closed": "✅", "half_open": "🟡", "open": "⛔️"}
+    lines = [
+        messages.ADMIN_BREAKER_ROW.format(icon=icons.get(row["state"], "❓"), **row)
+        for row in resilience.breaker_states()
+    ]
+    await bot.send_message(message.chat.id, "\n".join(lines))
+
+
+def _format_requests(requests: dict) -> str:
+    parts = [
+        f"{service}/{mode}: {count}"
+        for service, modes in sorted(requests.items())
+        for mode, count in sorted(modes.items())
+    ]
+    return "، ".join(parts) or "0"
+
+
+@bot.message_handler(commands=["stats"], func=is_admin)
+async def stats_cmd(message: Message):
+    """
+    Daily signups, requests, outcomes and revenue for the last week, read from the rollups.
+    """
+    days = 7
+    lines = [messages.ADMIN_STATS_HEADER.format(days=days)]
+    for day in await analytics.get_recent_stats(days):
+        c = day.counters
+        status = c.get("status", {})
+        lines.append(messages.ADMIN_STATS_DAY.format(
+            day=day.day,
+            signups=c.get("signups", 0),
+            referrals=c.get("referrals", 0),
+            payments=c.get("payments", 0),
+            revenue=c.get("revenue", 0),
+            coins_sold=c.get("coins_sold", 0),
+            requests=_format_requests(c.get("requests", {})),
+            done=status.get("done", 0),
+            error=status.get("error", 0),
+            cancelled=status.get("cancelled", 0),
+            cache_hits=c.get("cache_hits", 0),
+            deferred=_format_requests(c.get("deferred", {})),
+        ))
+    await bot.send_message(message.chat.id, "\n\n".join(lines))
+
+
+@bot.message_handler(commands=["stats_backfill"], func=is_admin)
+async def stats_backfill_cmd(message: Message):
+    """
+    Rebuilds the last N days of rollups from the source collections.
+    """
+    try:
+        days = int(message.text.split()[1])
+        if days < 1:
+            raise ValueError
+    except (IndexError, ValueError):
+        return await bot.send_message(message.chat.id, messages.ADMIN_USAGE_STATS_BACKFILL)
+
+    await analytics.backfill(days)
+    await bot.send_message(message.chat.id, messages.ADMIN_STATS_BACKFILL_DONE.format(days=days))
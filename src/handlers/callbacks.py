@@ -6,13 +6,20 @@ from datetime import datetime
 from telebot.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 
 from src.bot import bot
+from src.database import majority_writes
 from src.models.app_config import AppConfig
 from src.models.payment import Payment
 from src.models.user import User
 from src.models.generation import Generation
 from src.services.zarinpal_client import ZarinpalClient
+from src.services import analytics, credit_ledger, rate_limit
+from src.services.unit_of_work import flush
+from src.services.result_delivery import send_original_file
+from src.services.generation_queue import cancel_if_queued
+from src.router import router
 from src.texts import messages, buttons
 from src.handlers.messages import process_generation_request, show_confirmation_prompt
+from src.handlers.commands import build_history_page
 
 logger = logging.getLogger("pp_bot.handlers.callbacks")
 
@@ -50,20 +57,19 @@ async def show_template_gallery(chat_id: int, gen_uid: UUID, page: int = 0, gend
     
     markup = InlineKeyboardMarkup(row_width=2)
     template_buttons = [
-        InlineKeyboardButton(f"«{t['name']}»", callback_data=f"select_template_{gen_uid}_{t['id']}")
+        InlineKeyboardButton(f"«{t['name']}»", callback_data=await router.pack("template", gen_uid, t["id"]))
         for t in paginated_templates
     ]
     markup.add(*template_buttons)
 
     pagination_buttons = []
-    gender_payload = f"_{gender}" if gender else ""
     if page > 0:
         pagination_buttons.append(
-            InlineKeyboardButton("⬅️ قبلی", callback_data=f"gallery_page_{gen_uid}_{page - 1}{gender_payload}")
+            InlineKeyboardButton("⬅️ قبلی", callback_data=await router.pack("gallery", gen_uid, page - 1, gender))
         )
     if end_index < len(templates):
         pagination_buttons.append(
-            InlineKeyboardButton("بعدی ➡️", callback_data=f"gallery_page_{gen_uid}_{page + 1}{gender_payload}")
+            InlineKeyboardButton("بعدی ➡️", callback_data=await router.pack("gallery", gen_uid, page + 1, gender))
         )
     if pagination_buttons:
         markup.add(*pagination_buttons)
@@ -73,59 +79,46 @@ async def show_template_gallery(chat_id: int, gen_uid: UUID, page: int = 0, gend
     await bot.send_message(chat_id, messages.SELECT_TEMPLATE, reply_markup=markup)
 
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("select_service_"))
-async def handle_service_selection(call: CallbackQuery):
+@router.callback("service", UUID, str, legacy="select_service")
+async def handle_service_selection(call: CallbackQuery, gen_uid: UUID, service: str):
     """
     Handles the initial service selection (Product Photoshoot vs. Modeling).
     """
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_")
-        gen_uid = UUID(parts[2])
-        service = parts[3]
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
 
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
     if not gen or gen.status != "init":
         return await bot.edit_message_text(messages.GENERATION_NOT_FOUND_FOR_USER, chat_id, call.message.message_id)
 
     gen.service = service
-    await gen.save()
 
     if service == "photoshoot":
         gen.status = "awaiting_mode_selection"
-        await gen.save()
+        await flush(gen)
         markup = InlineKeyboardMarkup(row_width=1)
         markup.add(
-            InlineKeyboardButton(buttons.MODE_TEMPLATE, callback_data=f"select_mode_{gen_uid}_template"),
-            InlineKeyboardButton(buttons.MODE_MANUAL, callback_data=f"select_mode_{gen_uid}_manual"),
-            InlineKeyboardButton(buttons.MODE_AUTOMATIC, callback_data=f"select_mode_{gen_uid}_automatic")
+            InlineKeyboardButton(buttons.MODE_TEMPLATE, callback_data=await router.pack("mode", gen_uid, "template")),
+            InlineKeyboardButton(buttons.MODE_MANUAL, callback_data=await router.pack("mode", gen_uid, "manual")),
+            InlineKeyboardButton(buttons.MODE_AUTOMATIC, callback_data=await router.pack("mode", gen_uid, "automatic"))
         )
         await bot.edit_message_text(messages.SELECT_MODE, chat_id, call.message.message_id, reply_markup=markup)
     
     elif service == "modeling":
         gen.status = "awaiting_model_gender"
-        await gen.save()
+        await flush(gen)
         markup = InlineKeyboardMarkup(row_width=2)
         markup.add(
-            InlineKeyboardButton(buttons.MODEL_GENDER_FEMALE, callback_data=f"select_gender_{gen_uid}_female"),
-            InlineKeyboardButton(buttons.MODEL_GENDER_MALE, callback_data=f"select_gender_{gen_uid}_male")
+            InlineKeyboardButton(buttons.MODEL_GENDER_FEMALE, callback_data=await router.pack("gender", gen_uid, "female")),
+            InlineKeyboardButton(buttons.MODEL_GENDER_MALE, callback_data=await router.pack("gender", gen_uid, "male"))
         )
         await bot.edit_message_text(messages.SELECT_MODEL_GENDER, chat_id, call.message.message_id, reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("select_gender_"))
-async def handle_gender_selection(call: CallbackQuery):
+@router.callback("gender", UUID, str, legacy="select_gender")
+async def handle_gender_selection(call: CallbackQuery, gen_uid: UUID, gender: str):
     """
     Handles model gender selection and shows the modeling template gallery.
     """
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_")
-        gen_uid = UUID(parts[2])
-        gender = parts[3]
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
 
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
     if not gen or gen.status != "awaiting_model_gender":
@@ -133,80 +126,56 @@ async def handle_gender_selection(call: CallbackQuery):
     
     gen.model_gender = gender
     gen.status = "awaiting_template_selection"
-    await gen.save()
+    await flush(gen)
     
     await bot.delete_message(chat_id, call.message.message_id)
     await show_template_gallery(chat_id, gen_uid, page=0, gender=gender)
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("select_mode_"))
-async def handle_mode_selection(call: CallbackQuery):
+@router.callback("mode", UUID, str, legacy="select_mode")
+async def handle_mode_selection(call: CallbackQuery, gen_uid: UUID, mode: str):
     """
     UPDATED: Deletes the mode selection message before showing the gallery.
     """
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_")
-        gen_uid = UUID(parts[2])
-        mode = parts[3]
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
 
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
     if not gen or gen.status != "awaiting_mode_selection":
         return await bot.edit_message_text(messages.GENERATION_NOT_FOUND_FOR_USER, chat_id, call.message.message_id)
     
     gen.generation_mode = mode
-    
+    gen.status = "awaiting_template_selection" if mode == "template" else "awaiting_description"
+    await flush(gen)
+
     await bot.delete_message(chat_id, call.message.message_id)
 
     if mode == "template":
-        gen.status = "awaiting_template_selection"
-        await gen.save()
         await show_template_gallery(chat_id, gen_uid, page=0)
 
     elif mode == "manual":
-        gen.status = "awaiting_description"
-        await gen.save()
         await bot.send_message(chat_id, messages.PROVIDE_FULL_DESCRIPTION)
 
     elif mode == "automatic":
-        gen.status = "awaiting_description"
-        await gen.save()
         await bot.send_message(chat_id, messages.PROVIDE_SIMPLE_CAPTION)
 
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("gallery_page_"))
-async def handle_gallery_pagination(call: CallbackQuery):
+@router.callback("gallery", UUID, int, str, legacy="gallery_page")
+async def handle_gallery_pagination(call: CallbackQuery, gen_uid: UUID, page: int, gender: str | None = None):
     """
     Handles next/previous page buttons for both gallery types.
     """
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_")
-        gen_uid = UUID(parts[2])
-        page = int(parts[3])
-        # Gender might be empty, so handle it carefully
-        gender = parts[4] if len(parts) > 4 and parts[4] else None
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
-    
+
     await bot.delete_message(chat_id, call.message.message_id)
     # await bot.delete_message(chat_id, call.message.message_id-1)
     await show_template_gallery(chat_id, gen_uid, page, gender=gender)
 
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("select_template_"))
-async def handle_template_selection(call: CallbackQuery):
+@router.callback("template", UUID, str, legacy="select_template")
+async def handle_template_selection(call: CallbackQuery, gen_uid: UUID, template_id: str):
     """
     Handles final template selection for both services.
     """
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_", 3)
-        gen_uid = UUID(parts[2])
-        template_id = parts[3]
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
 
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
     if not gen or gen.status != "awaiting_template_selection":
@@ -216,7 +185,6 @@ async def handle_template_selection(call: CallbackQuery):
         return await bot.send_message(chat_id, messages.GENERATION_NOT_FOUND_FOR_USER)
         
     gen.template_id = template_id
-    await gen.save()
     
     await bot.delete_message(chat_id, call.message.message_id)
     # await bot.delete_message(chat_id, call.message.message_id-1)
@@ -227,25 +195,29 @@ async def handle_template_selection(call: CallbackQuery):
         await show_confirmation_prompt(gen)
     else: # photoshoot
         gen.status = "awaiting_product_name"
-        await gen.save()
+        await flush(gen)
         await bot.send_message(chat_id, messages.PROVIDE_PRODUCT_NAME)
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("confirm_"))
-async def handle_confirmation(call: CallbackQuery):
-    # ... (بدون تغییر)
+@router.callback("confirm", UUID, str, legacy="confirm")
+async def handle_confirmation(call: CallbackQuery, gen_uid: UUID, action: str):
     chat_id = call.message.chat.id
-    try:
-        parts = call.data.split("_")
-        gen_uid = UUID(parts[1])
-        action = parts[2]
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
 
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
+    if gen and gen.status == "preparing":
+        return await bot.answer_callback_query(call.id, messages.REQUEST_ALREADY_ACCEPTED)
     if not gen or gen.status != "awaiting_confirmation":
         return await bot.edit_message_caption(caption=messages.GENERATION_NOT_FOUND_FOR_USER, chat_id=chat_id, message_id=call.message.message_id)
 
     if action == "accept":
+        # Confirmation starts downloads, uploads and LLM calls before any credit is debited
+        if await _rate_limited(call, "confirm"): return
+        # Claim the draft first, so a double tap cannot start a second pipeline run
+        claimed = await Generation.get_motor_collection().update_one(
+            {"_id": gen.id, "status": "awaiting_confirmation"},
+            {"$set": {"status": "preparing", "updated_at": datetime.utcnow()}},
+        )
+        if claimed.modified_count == 0:
+            return await bot.answer_callback_query(call.id, messages.REQUEST_ALREADY_ACCEPTED)
         await bot.edit_message_caption(caption=messages.REQUEST_ACCEPTED, chat_id=chat_id, message_id=call.message.message_id)
         await process_generation_request(gen_uid)
 
@@ -257,25 +229,34 @@ async def handle_confirmation(call: CallbackQuery):
             gen.status = "awaiting_description"
             prompt_text = messages.EDIT_PROMPT_DESCRIPTION
         
-        await gen.save()
+        await flush(gen)
         await bot.edit_message_caption(caption=prompt_text, chat_id=chat_id, message_id=call.message.message_id)
 
     elif action == "cancel":
         gen.status = "cancelled"
-        await gen.save()
+        await flush(gen)
         await bot.edit_message_caption(caption=messages.REQUEST_CANCELLED, chat_id=chat_id, message_id=call.message.message_id)
 
 
+async def _rate_limited(call: CallbackQuery, scope: str) -> bool:
+    """
+    Takes a rate-limit token for the chat; when there is none, tells the user how long
+    to wait in an alert and leaves the buttons in place so they can retry.
+    """
+    wait = await rate_limit.acquire(scope, call.message.chat.id)
+    if wait is None:
+        return False
+    await bot.answer_callback_query(
+        call.id, messages.RATE_LIMITED.format(seconds=rate_limit.format_wait(wait)), show_alert=True
+    )
+    return True
+
+
 # --- Payment Handlers ---
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("buy_"))
-async def process_purchase(call: CallbackQuery):
-    # ... (بدون تغییر)
+@router.callback("buy", int, legacy="buy")
+async def process_purchase(call: CallbackQuery, pkg_idx: int):
     chat_id = call.message.chat.id
-    try:
-        pkg_idx = int(call.data.split("_", 1)[1])
-    except (ValueError, IndexError):
-        await bot.answer_callback_query(call.id, messages.INVALID_CHOICE, show_alert=True)
-        return
+    if await _rate_limited(call, "payment"): return
 
     await bot.delete_message(chat_id, call.message.message_id)
 
@@ -304,7 +285,7 @@ async def process_purchase(call: CallbackQuery):
 
     markup = InlineKeyboardMarkup()
     markup.add(InlineKeyboardButton(buttons.COMPLETE_PAYMENT, url=payment.payment_link))
-    markup.add(InlineKeyboardButton(buttons.I_HAVE_PAID, callback_data=f"verify_{payment.uid}"))
+    markup.add(InlineKeyboardButton(buttons.I_HAVE_PAID, callback_data=await router.pack("verify", payment.uid)))
 
     await bot.send_message(
         chat_id,
@@ -314,16 +295,10 @@ async def process_purchase(call: CallbackQuery):
     )
 
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("verify_"))
-async def verify_payment(call: CallbackQuery):
-    # ... (بدون تغییر)
+@router.callback("verify", UUID, legacy="verify")
+async def verify_payment(call: CallbackQuery, pay_uid: UUID):
     chat_id = call.message.chat.id
-    try:
-        pay_uid = UUID(call.data.split("_", 1)[1])
-    except:
-        await bot.delete_message(chat_id, call.message.message_id)
-        await bot.send_message(chat_id, messages.INVALID_PAYMENT_ID)
-        return
+    if await _rate_limited(call, "verify"): return
 
     await bot.delete_message(chat_id, call.message.message_id)
 
@@ -337,19 +312,19 @@ async def verify_payment(call: CallbackQuery):
     status = verify_res.get("status")
 
     if verify_res.get("success") and status in (100, 101):
-        is_newly_verified = pay.status != "completed" and status == 100
         pay.status = "completed"
         pay.transaction_id = str(verify_res.get("ref_id"))
         pay.completed_at = datetime.utcnow()
-        await pay.save()
+        await majority_writes(Payment).update_one({"_id": pay.id}, {"$set": {
+            "status": pay.status, "transaction_id": pay.transaction_id, "completed_at": pay.completed_at,
+        }})
 
+        # The ledger key makes crediting exactly-once, even for concurrent verify taps.
+        is_newly_verified = await credit_ledger.apply_credit(
+            pay.chat_id, pay.package_coins, "payment", f"payment:{pay.uid}", mark_paid=True
+        )
         if is_newly_verified:
-            user = await User.find_one(User.chat_id == chat_id)
-            if user:
-                user.credits += pay.package_coins
-                user.paid = True
-                await user.save()
-            
+            await analytics.record_payment(pay.amount, pay.package_coins)
             await bot.send_message(
                 chat_id,
                 messages.PAYMENT_VERIFIED_SUCCESS.format(package_coins=f"{pay.package_coins:,}"),
@@ -363,15 +338,23 @@ async def verify_payment(call: CallbackQuery):
             )
         return
 
+    if status == "CIRCUIT_OPEN":
+        # Zarinpal was never asked, so the payment keeps whatever status it has
+        markup = InlineKeyboardMarkup()
+        markup.add(InlineKeyboardButton(buttons.RETRY_VERIFICATION, callback_data=await router.pack("verify", pay.uid)))
+        return await bot.send_message(chat_id, messages.UPSTREAM_UNAVAILABLE, reply_markup=markup)
+
     else:
-        pay.status = "failed"
-        await pay.save()
+        # Never downgrades a payment a concurrent verify has already completed
+        await Payment.get_motor_collection().update_one(
+            {"_id": pay.id, "status": {"$ne": "completed"}}, {"$set": {"status": "failed"}}
+        )
         error_message = messages.PAYMENT_VERIFICATION_GENERIC_ERROR.format(
             authority=pay.authority, chat_id=pay.chat_id
         )
         markup = InlineKeyboardMarkup()
         markup.add(InlineKeyboardButton(buttons.COMPLETE_PAYMENT, url=pay.payment_link))
-        markup.add(InlineKeyboardButton(buttons.RETRY_VERIFICATION, callback_data=f"verify_{pay.uid}"))
+        markup.add(InlineKeyboardButton(buttons.RETRY_VERIFICATION, callback_data=await router.pack("verify", pay.uid)))
         
         await bot.send_message(
             chat_id,
@@ -379,51 +362,56 @@ async def verify_payment(call: CallbackQuery):
             reply_markup=markup
         )
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("resend_"))
-async def handle_resend_image(call: CallbackQuery):
+@router.callback("resend", UUID, legacy="resend")
+async def handle_resend_image(call: CallbackQuery, gen_uid: UUID):
     """
     Handles the 'Resend' button from the project history, sending the final image again.
     """
-    try:
-        gen_uid = UUID(call.data.split("_")[1])
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
-
     gen = await Generation.find_one(Generation.uid == gen_uid)
 
     if gen and gen.status == "done" and gen.result_url:
         await bot.answer_callback_query(call.id, text="در حال ارسال مجدد تصویر...")
-        await bot.send_photo(call.message.chat.id, photo=gen.result_url, caption=f"تصویر پروژه: {gen.description or gen.product_name}")
+        await bot.send_photo(call.message.chat.id, photo=gen.result_url, caption=f"تصویر پروژه: {gen.summary or gen.product_name}")
     else:
         await bot.answer_callback_query(call.id, text="متاسفانه تصویر این پروژه یافت نشد.", show_alert=True)
 
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("cancel_"))
-async def handle_cancel_request(call: CallbackQuery):
+@router.callback("original", UUID, legacy="original")
+async def handle_original_file(call: CallbackQuery, gen_uid: UUID):
+    """
+    Sends the lossless original of a finished generation as a document.
+    """
+    gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == call.message.chat.id)
+
+    if gen and gen.status == "done" and gen.result_url:
+        await bot.answer_callback_query(call.id, text=messages.SENDING_ORIGINAL_FILE)
+        await send_original_file(gen)
+    else:
+        await bot.answer_callback_query(call.id, text=messages.ORIGINAL_FILE_NOT_FOUND, show_alert=True)
+
+
+@router.callback("cancel", UUID, legacy="cancel")
+async def handle_cancel_request(call: CallbackQuery, gen_uid: UUID):
     """
     Handles the 'Cancel Request' button from the project history.
     """
     chat_id = call.message.chat.id
-    try:
-        gen_uid = UUID(call.data.split("_")[1])
-    except (IndexError, ValueError):
-        return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
-
     gen = await Generation.find_one(Generation.uid == gen_uid, Generation.chat_id == chat_id)
 
     if not gen:
         return await bot.answer_callback_query(call.id, "پروژه یافت نشد.", show_alert=True)
 
-    if gen.status == "inqueue":
-        gen.status = "cancelled"
-        await gen.save()
-        
+    # Atomic with respect to queue workers: fails if a replica has already claimed the job
+    if await cancel_if_queued(gen):
         # Refund credits
-        user = await User.find_one(User.chat_id == chat_id)
-        if user and gen.cost:
-            user.credits += gen.cost
-            await user.save()
-        
-        await bot.edit_message_text(messages.REQUEST_CANCELLED_SUCCESS, chat_id, call.message.message_id)
+        if gen.cost:
+            await credit_ledger.refund_generation(chat_id, gen.uid, int(gen.cost))
+        await analytics.record_generation_finished("cancelled")
+
+        await bot.answer_callback_query(call.id, messages.REQUEST_CANCELLED_SUCCESS, show_alert=True)
+        # Refresh the history message so the cancelled project shows its new status
+        text, markup = await build_history_page(chat_id)
+        if text:
+            await bot.edit_message_text(text, chat_id, call.message.message_id, reply_markup=markup, parse_mode="Markdown")
     else:
         await bot.answer_callback_query(call.id, messages.REQUEST_ALREADY_PROCESSED, show_alert=True)
\ No newline at end of file
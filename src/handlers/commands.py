@@ -1,16 +1,20 @@
 # src/handlers/commands.py
 
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from bson import ObjectId
 from telebot.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, ChatMember
 from telebot.apihelper import ApiTelegramException
 
 from src.bot import bot
 from src.models.user import User
-from src.models.generation import Generation
+from src.models.generation import Generation, GenerationHistoryView
 from src.models.app_config import AppConfig
+from src.router import router
 from src.texts import messages, buttons
 from src.config import settings
+from src.services import analytics, credit_ledger, queue_estimator, referrals
+from src.services.fast_reads import get_user_credits
 
 logger = logging.getLogger("pp_bot.handlers.commands")
 
@@ -107,9 +111,13 @@ async def start_cmd(message: Message):
             username=message.from_user.username,
             first_name=message.from_user.first_name,
             last_name=message.from_user.last_name,
-            referred_by=referrer_id
+            referred_by=referrer_id,
+            credits=0
         )
         await user.insert()
+        await analytics.record_signup()
+        # هدیه عضویت از طریق دفتر اعتبار ثبت می‌شود
+        await credit_ledger.apply_credit(chat_id, settings.NEW_USER_GIFT_COINS, "gift", f"gift:{chat_id}")
         logger.info(f"[start_cmd] Pre-registered user with chat_id={chat_id}, referred_by={referrer_id}")
 
     # ۳. بررسی عضویت در کانال
@@ -122,9 +130,8 @@ async def start_cmd(message: Message):
     # بررسی می‌کنیم که آیا این اولین بار است که کاربر فعال می‌شود یا خیر
     if not user.is_active:
         # این یک کاربر جدید است که فرآیند را کامل می‌کند
-        user.is_active = True
-        user.updated_at = datetime.utcnow()
-        await user.save()
+        # Partial $set so the whole document never overwrites the ledger-maintained balance
+        await user.set({User.is_active: True, User.updated_at: datetime.utcnow()})
         
         logger.info(f"[start_cmd] New user activated: chat_id={chat_id}")
         
@@ -135,11 +142,9 @@ async def start_cmd(message: Message):
         # اگر کاربر توسط فردی دعوت شده، به او پاداش می‌دهیم
         if user.referred_by:
             referrer = await User.find_one(User.chat_id == user.referred_by)
-            if referrer:
-                reward = settings.REFERRAL_REWARD_COINS
-                referrer.credits += reward
-                referrer.refs.append(chat_id)
-                await referrer.save()
+            reward = settings.REFERRAL_REWARD_COINS
+            if referrer and await referrals.reward_referral(referrer.chat_id, chat_id, reward):
+                await analytics.record_referral()
                 logger.info(f"[start_cmd] Gave {reward} credits to referrer: chat_id={referrer.chat_id}")
                 try:
                     # اطلاعات کاربر جدید را از آبجکت message استخراج می‌کنیم
@@ -159,8 +164,7 @@ async def start_cmd(message: Message):
                     logger.error(f"Could not notify referrer {referrer.chat_id}: {e}")
     else:
         # این یک کاربر قدیمی است که بازگشته
-        user.updated_at = datetime.utcnow()
-        await user.save()
+        await user.set({User.updated_at: datetime.utcnow()})
         logger.info(f"[start_cmd] Returning user updated: chat_id={chat_id}")
         await bot.send_message(chat_id, messages.START_RETURN_USER, reply_markup=create_main_keyboard())
 
@@ -171,28 +175,132 @@ async def cancel_cmd(message: Message):
     await bot.send_message(message.chat.id, "برای لغو یک درخواست، لطفا به بخش «پروژه‌های من» رفته و از دکمه لغو در کنار پروژه مورد نظر استفاده کنید.")
 
 
+HISTORY_PAGE_SIZE = 5
+STATUS_MAP = {"done": "✅ انجام شده", "preparing": "⏳ در حال آماده‌سازی", "processing": "⏳ در حال پردازش", "inqueue": "... در صف", "error": "❌ خطا", "cancelled": "⭕️ لغو شده"}
+
+
+def _cursor(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _from_cursor(cursor: int) -> datetime:
+    return datetime.utcfromtimestamp(cursor / 1000)
+
+
+async def _queue_eta_line(gen: GenerationHistoryView) -> str:
+    """
+    Position and ETA for a queued project. A failed estimate only drops this line,
+    never the history page.
+    """
+    try:
+        estimate = await queue_estimator.estimate(gen)
+    except Exception as e:
+        logger.warning(f"Queue estimate failed for uid={gen.uid}: {e}")
+        return ""
+    if not estimate:
+        return ""
+    return messages.PROJECT_QUEUE_ETA.format(
+        position=estimate.position, eta=queue_estimator.format_eta(estimate.eta_seconds)
+    )
+
+
+async def build_history_page(
+    chat_id: int, older_than: int | None = None, newer_than: int | None = None, cursor_id: ObjectId | None = None,
+):
+    """
+    Renders one page of project history as a single message and keyboard.
+    Pages are keyset-paginated on (chat_id, created_at, _id); the cursor is the
+    created_at (in ms) and _id of the first/last project shown, carried in callback
+    data. _id breaks ties between projects created in the same millisecond.
+    Returns (None, None) if the page is empty.
+    Read from the primary: users open history right after queueing or cancelling a
+    project and must see that change.
+    """
+    collection = Generation.get_motor_collection()
+    projection = {field: 1 for field in GenerationHistoryView.model_fields}
+
+    def after(cursor: int, op: str) -> dict:
+        at = _from_cursor(cursor)
+        if cursor_id is None:  # buttons sent before the _id tie-breaker existed
+            return {"created_at": {op: at}}
+        return {"$or": [{"created_at": {op: at}}, {"created_at": at, "_id": {op: cursor_id}}]}
+
+    async def fetch(keyset: dict, direction: int) -> list[GenerationHistoryView]:
+        cursor = collection.find({"chat_id": chat_id, **keyset}, projection)
+        cursor = cursor.sort([("created_at", direction), ("_id", direction)]).limit(HISTORY_PAGE_SIZE + 1)
+        return [GenerationHistoryView.model_validate(doc) async for doc in cursor]
+
+    if newer_than is not None:
+        gens = await fetch(after(newer_than, "$gt"), 1)
+        has_newer = len(gens) > HISTORY_PAGE_SIZE
+        gens = list(reversed(gens[:HISTORY_PAGE_SIZE]))
+        has_older = True
+    else:
+        gens = await fetch(after(older_than, "$lt") if older_than is not None else {}, -1)
+        has_older = len(gens) > HISTORY_PAGE_SIZE
+        gens = gens[:HISTORY_PAGE_SIZE]
+        has_newer = older_than is not None
+
+    if not gens:
+        return None, None
+
+    lines = [messages.MY_PROJECTS_HEADER]
+    markup = InlineKeyboardMarkup(row_width=2)
+    action_buttons = []
+    for n, gen in enumerate(gens, start=1):
+        status_icon = STATUS_MAP.get(gen.status, "❓")
+        description = gen.product_name or gen.summary or "پروژه بدون عنوان"
+        if len(description) > 30: description = description[:30] + "..."
+        local_time = gen.created_at.strftime("%Y-%m-%d %H:%M")
+        line = f"{n}. " + messages.PROJECT_STATUS_FORMAT.format(status_icon=status_icon, description=description, date=local_time)
+        if gen.status == "inqueue":
+            line += await _queue_eta_line(gen)
+        lines.append(line)
+        if gen.status == "done" and gen.result_url:
+            action_buttons.append(InlineKeyboardButton(f"{n}. {buttons.RESEND_IMAGE}", callback_data=await router.pack("resend", gen.uid)))
+        if gen.status == "inqueue":
+            action_buttons.append(InlineKeyboardButton(f"{n}. {buttons.CANCEL_REQUEST}", callback_data=await router.pack("cancel", gen.uid)))
+    if action_buttons:
+        markup.add(*action_buttons)
+
+    # created_at comes back from Mongo at ms precision, so the cursor round-trips exactly
+    pagination_buttons = []
+    if has_newer:
+        pagination_buttons.append(InlineKeyboardButton(buttons.HISTORY_NEWER, callback_data=await router.pack("hist", "n", _cursor(gens[0].created_at), gens[0].id)))
+    if has_older:
+        pagination_buttons.append(InlineKeyboardButton(buttons.HISTORY_OLDER, callback_data=await router.pack("hist", "o", _cursor(gens[-1].created_at), gens[-1].id)))
+    if pagination_buttons:
+        markup.add(*pagination_buttons)
+
+    return "\n\n".join(lines), markup if markup.keyboard else None
+
+
 @bot.message_handler(commands=["myprojects"])
 async def my_projects_cmd(message: Message):
     if not await check_membership(message): return
 
     chat_id = message.chat.id
-    user_generations = await Generation.find(Generation.chat_id == chat_id).sort(-Generation.created_at).limit(5).to_list()
-    if not user_generations:
+    text, markup = await build_history_page(chat_id)
+    if not text:
         return await bot.send_message(chat_id, messages.NO_PROJECTS_FOUND)
-    await bot.send_message(chat_id, messages.MY_PROJECTS_HEADER)
-    status_map = {"done": "✅ انجام شده", "processing": "⏳ در حال پردازش", "inqueue": "... در صف", "error": "❌ خطا", "cancelled": "⭕️ لغو شده"}
-    for gen in user_generations:
-        status_icon = status_map.get(gen.status, "❓")
-        description = gen.product_name or gen.description or "پروژه بدون عنوان"
-        if len(description) > 30: description = description[:30] + "..."
-        local_time = gen.created_at.strftime("%Y-%m-%d %H:%M")
-        text = messages.PROJECT_STATUS_FORMAT.format(status_icon=status_icon, description=description, date=local_time)
-        markup = InlineKeyboardMarkup()
-        if gen.status == "done" and gen.result_url:
-            markup.add(InlineKeyboardButton(buttons.RESEND_IMAGE, callback_data=f"resend_{gen.uid}"))
-        if gen.status == "inqueue":
-            markup.add(InlineKeyboardButton(buttons.CANCEL_REQUEST, callback_data=f"cancel_{gen.uid}"))
-        await bot.send_message(chat_id, text, reply_markup=markup if markup.keyboard else None, parse_mode="Markdown")
+    await bot.send_message(chat_id, text, reply_markup=markup, parse_mode="Markdown")
+
+
+@router.callback("hist", str, int, str, legacy="hist")
+async def handle_history_page(call: CallbackQuery, direction: str, cursor: int, cursor_id: str | None = None):
+    """
+    Pages through project history by editing the history message in place.
+    """
+    chat_id = call.message.chat.id
+    tie_breaker = ObjectId(cursor_id) if cursor_id and ObjectId.is_valid(cursor_id) else None
+    if direction == "n":
+        text, markup = await build_history_page(chat_id, newer_than=cursor, cursor_id=tie_breaker)
+    else:
+        text, markup = await build_history_page(chat_id, older_than=cursor, cursor_id=tie_breaker)
+
+    await bot.answer_callback_query(call.id)
+    if text:
+        await bot.edit_message_text(text, chat_id, call.message.message_id, reply_markup=markup, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["invite"])
@@ -218,8 +326,7 @@ async def generate_cmd(message: Message):
 async def balance_cmd(message: Message):
     if not await check_membership(message): return
     chat_id = message.chat.id
-    user = await User.find_one(User.chat_id == chat_id)
-    credits = user.credits if user else 0
+    credits = await get_user_credits(chat_id) or 0
     await bot.send_message(chat_id, messages.BALANCE_CHECK.format(credits=f"{credits:,}"))
 
 @bot.message_handler(commands=["buy"])
@@ -231,7 +338,7 @@ async def buy_cmd(message: Message):
     text = messages.NO_PACKAGES
     if cfg_packages and cfg_packages.credit_packages:
         for label, price, coins, idx in cfg_packages.credit_packages:
-            markup.add(InlineKeyboardButton(label, callback_data=f"buy_{idx}"))
+            markup.add(InlineKeyboardButton(label, callback_data=await router.pack("buy", idx)))
         if markup.keyboard:
             cfg_shop = await AppConfig.find_one(AppConfig.type == "shop_messages")
             text = cfg_shop.shop_menu_message if cfg_shop and cfg_shop.shop_menu_message else "بسته‌های اعتبار موجود:"
@@ -247,50 +354,50 @@ async def menu_cmd(message: Message):
     if not await check_membership(message): return
     markup = InlineKeyboardMarkup(row_width=2)
     markup.add(
-        InlineKeyboardButton(buttons.MENU_GENERATE, callback_data="menu_generate"),
-        InlineKeyboardButton(buttons.MENU_BALANCE, callback_data="menu_balance"),
-        InlineKeyboardButton(buttons.MENU_BUY, callback_data="menu_buy"),
-        InlineKeyboardButton(buttons.MENU_INVITE, callback_data="menu_invite"),
-        InlineKeyboardButton(buttons.MENU_HELP, callback_data="menu_help")
+        InlineKeyboardButton(buttons.MENU_GENERATE, callback_data=await router.pack("menu", "generate")),
+        InlineKeyboardButton(buttons.MENU_BALANCE, callback_data=await router.pack("menu", "balance")),
+        InlineKeyboardButton(buttons.MENU_BUY, callback_data=await router.pack("menu", "buy")),
+        InlineKeyboardButton(buttons.MENU_INVITE, callback_data=await router.pack("menu", "invite")),
+        InlineKeyboardButton(buttons.MENU_HELP, callback_data=await router.pack("menu", "help"))
     )
     await bot.send_message(message.chat.id, messages.MENU_PROMPT, reply_markup=markup)
 
 
 # --- Handlers for Main Keyboard Buttons ---
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_NEW)
+@router.text(buttons.MAIN_KEYBOARD_NEW)
 async def handle_new_project_button(message: Message):
     if not await check_membership(message): return
     await generate_cmd(message)
 
-@bot.message_handler(func=lambda message: message.text == buttons.MODELING_PHOTOSHOOT)
+@router.text(buttons.MODELING_PHOTOSHOOT)
 async def handle_modeling_button(message: Message):
     if not await check_membership(message): return
     # This will trigger the modeling flow
     # For now, we just prompt the user, the actual flow starts with a photo.
     await bot.send_message(message.chat.id, "برای شروع سرویس عکاسی با مدل، لطفا عکس لباس خود را ارسال کنید.\n\nاین قابلیت موقتا غیر فعال است")
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_PROJECTS)
+@router.text(buttons.MAIN_KEYBOARD_PROJECTS)
 async def handle_my_projects_button(message: Message):
     if not await check_membership(message): return
     await my_projects_cmd(message)
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_INVITE)
+@router.text(buttons.MAIN_KEYBOARD_INVITE)
 async def handle_invite_button(message: Message):
     if not await check_membership(message): return
     await invite_cmd(message)
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_BALANCE)
+@router.text(buttons.MAIN_KEYBOARD_BALANCE)
 async def handle_balance_button(message: Message):
     if not await check_membership(message): return
     await balance_cmd(message)
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_BUY)
+@router.text(buttons.MAIN_KEYBOARD_BUY)
 async def handle_buy_button(message: Message):
     if not await check_membership(message): return
     await buy_cmd(message)
 
-@bot.message_handler(func=lambda message: message.text == buttons.MAIN_KEYBOARD_HELP)
+@router.text(buttons.MAIN_KEYBOARD_HELP)
 async def handle_help_button(message: Message):
     if not await check_membership(message): return
     await help_cmd(message)
@@ -298,10 +405,9 @@ async def handle_help_button(message: Message):
 
 # --- Callback handlers for the inline /menu buttons ---
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("menu_"))
-async def handle_menu_callbacks(call: CallbackQuery):
+@router.callback("menu", str, legacy="menu")
+async def handle_menu_callbacks(call: CallbackQuery, action: str):
     if not await check_membership(call.message): return
-    action = call.data.split("_")[1]
     await bot.answer_callback_query(call.id)
     message_for_action = call.message
     message_for_action.text = f"/{action}"
@@ -1,12 +1,15 @@
 # src/handlers/messages.py
 
+import asyncio
 import logging
 import tempfile
 from pathlib import Path
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta
 import mimetypes 
 
+import logfire
+
 from telebot.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from beanie.operators import In, And
 
@@ -14,11 +17,24 @@ from src.bot import bot
 from src.models.generation import Generation
 from src.models.user import User
 from src.models.app_config import AppConfig
+from src.router import router
 from src.services.tapsage_storage import tapsage_upload
 from src.services.tapsage_client import TapsageClient
 from src.services.replicate_client import ReplicateClient
+from src.services.model_registry import DEFAULT_MODEL
 from src.texts import messages, buttons, prompts
 from src.services.openai_client import OpenAIClient
+from src.services import (
+    admission, analytics, credit_ledger, generation_payloads, job_metrics, queue_estimator, rate_limit, resilience,
+    result_cache, tracing,
+)
+from src.services.resilience import CircuitOpenError
+from src.services.stage_runner import StageRunner
+from src.services.unit_of_work import flush
+from src.services.fast_reads import get_user_credits, has_queued_generation
+from src.services.image_processing import pick_photo_size, preprocess_input_image
+from src.services.result_delivery import deliver_result
+from src.config import settings
 
 logger = logging.getLogger("pp_bot.handlers.messages")
 
@@ -30,20 +46,29 @@ async def handle_photo(message: Message):
     and asking the user to select a service.
     """
     chat_id = message.chat.id
+    wait = await rate_limit.acquire("photo", chat_id)
+    if wait is not None:
+        return await bot.send_message(chat_id, messages.RATE_LIMITED.format(seconds=rate_limit.format_wait(wait)))
     
+    # Reject too-small photos now, not after the user has picked a service and confirmed
+    photo = pick_photo_size(message.photo, settings.INPUT_TARGET_RESOLUTION, settings.INPUT_MIN_DIMENSION)
+    if min(photo.width, photo.height) < settings.INPUT_MIN_DIMENSION:
+        return await bot.send_message(chat_id, messages.INPUT_IMAGE_TOO_SMALL.format(min_side=settings.INPUT_MIN_DIMENSION))
+
     gen = Generation(
         chat_id=chat_id,
-        photo_file_id=message.photo[-1].file_id,
+        photo_file_id=photo.file_id,
         status="init",
-        model_name="black-forest-labs/flux-kontext-pro"
+        model_name=DEFAULT_MODEL.name,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.DRAFT_GENERATION_TTL_HOURS),
     )
     await gen.insert()
     logger.info(f"[handle_photo] New generation created. uid={gen.uid}")
 
     markup = InlineKeyboardMarkup(row_width=2)
     markup.add(
-        InlineKeyboardButton(buttons.PRODUCT_PHOTOSHOOT, callback_data=f"select_service_{gen.uid}_photoshoot"),
-        # InlineKeyboardButton(buttons.MODELING_PHOTOSHOOT, callback_data=f"select_service_{gen.uid}_modeling")
+        InlineKeyboardButton(buttons.PRODUCT_PHOTOSHOOT, callback_data=await router.pack("service", gen.uid, "photoshoot")),
+        # InlineKeyboardButton(buttons.MODELING_PHOTOSHOOT, callback_data=await router.pack("service", gen.uid, "modeling"))
     )
 
     await bot.send_message(chat_id, messages.SELECT_SERVICE, reply_markup=markup)
@@ -84,21 +109,24 @@ async def handle_text_messages(message: Message):
             gen.product_name = sanitized_text
             await show_confirmation_prompt(gen)
         elif gen.status == "awaiting_description":
-            gen.description = sanitized_text
-            await show_confirmation_prompt(gen)
+            await generation_payloads.save(gen.uid, expires_at=gen.expires_at, description=sanitized_text)
+            gen.summary = generation_payloads.summarize(sanitized_text)
+            await show_confirmation_prompt(gen, description=sanitized_text)
     else:
         logger.warning(f"[handle_text] User sent text '{message.text}' while in state '{gen.status}', which expects a button click.")
         await bot.send_message(chat_id, messages.PROMPT_TO_USE_BUTTONS)
 
 
 
-async def show_confirmation_prompt(gen: Generation):
+async def show_confirmation_prompt(gen: Generation, description: str | None = None):
     """
     Shows the confirmation prompt.
     UPDATED: Truncates long descriptions in the caption to avoid Telegram API errors.
+    The description is loaded from the generation's payload unless passed in.
+    Flushes the caller's pending changes together with the new status.
     """
     gen.status = "awaiting_confirmation"
-    await gen.save()
+    await flush(gen)
 
     caption = ""
     if gen.service == "photoshoot":
@@ -119,7 +147,9 @@ async def show_confirmation_prompt(gen: Generation):
             display_product_name = gen.product_name.replace('\\n', '\n').replace('\\"', '"')
             description_text = f"قالب: {template_name}\nنام محصول: {display_product_name}"
         else:
-            display_description = gen.description.replace('\\n', '\n').replace('\\"', '"')
+            if description is None:
+                description = (await generation_payloads.load(gen.uid)).description or ""
+            display_description = description.replace('\\n', '\n').replace('\\"', '"')
             
             # --- START: NEW TRUNCATION LOGIC ---
             if len(display_description) > 200:
@@ -149,9 +179,9 @@ async def show_confirmation_prompt(gen: Generation):
 
     markup = InlineKeyboardMarkup(row_width=2)
     markup.add(
-        InlineKeyboardButton(buttons.ACCEPT, callback_data=f"confirm_{gen.uid}_accept"),
-        InlineKeyboardButton(buttons.EDIT, callback_data=f"confirm_{gen.uid}_edit"),
-        InlineKeyboardButton(buttons.CANCEL_NEW_REQUEST, callback_data=f"confirm_{gen.uid}_cancel")
+        InlineKeyboardButton(buttons.ACCEPT, callback_data=await router.pack("confirm", gen.uid, "accept")),
+        InlineKeyboardButton(buttons.EDIT, callback_data=await router.pack("confirm", gen.uid, "edit")),
+        InlineKeyboardButton(buttons.CANCEL_NEW_REQUEST, callback_data=await router.pack("confirm", gen.uid, "cancel"))
     )
 
     await bot.send_photo(
@@ -163,19 +193,136 @@ async def show_confirmation_prompt(gen: Generation):
     )
 
 
+async def _download_input_image(gen: Generation) -> bytes:
+    file_info = await bot.get_file(gen.photo_file_id)
+    return await bot.download_file(file_info.file_path)
+
+
+async def _upload_input_image(gen: Generation, file_bytes: bytes) -> str:
+    """
+    Preprocesses the user's photo and uploads it to storage.
+    """
+    file_bytes = await preprocess_input_image(file_bytes)
+    gen.usage["upload_bytes"] = len(file_bytes)
+
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+        tmp_path.write_bytes(file_bytes)
+    try:
+        return str(await tapsage_upload(tmp_path, file_name=tmp_path.name))
+    finally:
+        tmp_path.unlink()
+
+
+async def _queued_message(gen: Generation) -> str:
+    """
+    The queued confirmation with the job's position and ETA. The job is already
+    queued and paid for at this point, so a failed estimate only drops the extra line.
+    """
+    try:
+        estimate = await queue_estimator.estimate(gen)
+    except Exception as e:
+        logger.warning(f"Queue estimate failed for uid={gen.uid}: {e}")
+        return messages.REQUEST_QUEUED_SUCCESS
+    if not estimate:
+        return messages.REQUEST_QUEUED_SUCCESS
+    return messages.REQUEST_QUEUED_SUCCESS + "\n" + messages.QUEUE_POSITION_ETA.format(
+        position=estimate.position, eta=queue_estimator.format_eta(estimate.eta_seconds)
+    )
+
+
+def _unless_cached(fn):
+    """
+    Wraps a pipeline stage so it is skipped (returns None) when the cache stage found a result.
+    """
+    async def stage(deps: dict):
+        if deps.get("cache"):
+            return None
+        return await fn(deps)
+    return stage
+
+
+async def _lookup_cached_result(gen: Generation, deps: dict):
+    gen.input_sha256, gen.input_phash = deps["fingerprint"]
+    payload = deps["payload"]
+    if "prompt" in deps:
+        payload.prompt = deps["prompt"]
+    return await result_cache.lookup(gen, payload)
+
+
+async def _build_prompt(gen: Generation, description: str | None, input_url: str | None) -> str:
+    """
+    Builds the final prompt from a template or via the LLM. Only automatic mode needs
+    the uploaded image URL.
+    """
+    final_prompt = ""
+    openai_client = OpenAIClient()
+
+    if gen.service == "photoshoot":
+        if gen.generation_mode == "template":
+            cfg = await AppConfig.find_one(AppConfig.type == "style_templates")
+            if cfg and cfg.style_templates:
+                for t in cfg.style_templates:
+                    if t["id"] == gen.template_id:
+                        final_prompt = t["prompt"].replace("{product_name}", "this product"); break
+
+        elif gen.generation_mode == "manual":
+            final_prompt = await openai_client.generate_prompt_from_text(description)
+            gen.usage.update(job_metrics.openai_usage(openai_client.last_usage))
+
+        elif gen.generation_mode == "automatic":
+            final_prompt = await openai_client.generate_prompt_from_image_url(description, input_url)
+            gen.usage.update(job_metrics.openai_usage(openai_client.last_usage))
+
+    elif gen.service == "modeling":
+        cfg = await AppConfig.find_one(AppConfig.type == "modeling_templates")
+        templates = cfg.female_templates if gen.model_gender == "female" else cfg.male_templates
+        if cfg and templates:
+            for t in templates:
+                if t["id"] == gen.template_id:
+                    final_prompt = t["prompt"]; break
+
+    return final_prompt
+
+
 async def process_generation_request(generation_id: UUID):
     """
-    OVERHAULED: Now generates prompts in-house using OpenAIClient before queueing.
-    FIXED: Ensures image is uploaded and URL is obtained BEFORE calling OpenAI.
+    Prices, prepares and queues a confirmed generation, as the root span of the job's trace.
+    """
+    with logfire.span("generation {uid}", uid=str(generation_id)):
+        await _process_generation_request(generation_id)
+
+
+async def _process_generation_request(generation_id: UUID):
+    """
+    Independent stages run concurrently: the config and user lookups, and the image
+    upload alongside prompt generation (except automatic mode, whose prompt needs the
+    upload URL).
     """
     gen = await Generation.find_one(Generation.uid == generation_id)
     if not gen: return logger.error(f"Could not find generation uid={generation_id}")
 
     chat_id = gen.chat_id
-    user = await User.find_one(User.chat_id == chat_id)
+    costs_cfg, user = await asyncio.gather(
+        AppConfig.find_one(AppConfig.type == "service_costs"),
+        User.find_one(User.chat_id == chat_id),
+    )
+
+    # 0. Admission control: under overload, free jobs are deferred before any upstream work.
+    # The draft stays as it is and the confirmation is shown again, so the user can retry.
+    tier = "paid" if user and user.paid else "free"
+    decision = await admission.check(tier, gen.service or "photoshoot")
+    if not decision.admitted:
+        await analytics.record_admission_deferred(tier, decision.reason)
+        await bot.send_message(chat_id, messages.SYSTEM_BUSY_DEFERRED.format(eta=queue_estimator.format_eta(decision.eta_seconds)))
+        return await show_confirmation_prompt(gen)
+
+    gen.expires_at = None  # confirmed: no longer a disposable draft; every path below saves
+    await generation_payloads.keep(gen.uid)
+    gen.stage_times["confirmed"] = datetime.utcnow()
+    gen.trace_id, gen.traceparent = tracing.current()
 
     # 1. Get cost
-    costs_cfg = await AppConfig.find_one(AppConfig.type == "service_costs")
     cost = 1
     if costs_cfg and costs_cfg.service_costs:
         try:
@@ -184,83 +331,119 @@ async def process_generation_request(generation_id: UUID):
         except (TypeError, KeyError):
             logger.error(f"Could not determine cost... Using fallback.")
     gen.cost = cost
+    await analytics.record_generation_requested(gen)
 
     # 2. Check credits
     if not user or user.credits < gen.cost:
-        gen.status = "error"; gen.error = "Insufficient credits"; await gen.save()
+        gen.status = "error"; gen.error = "Insufficient credits"; await flush(gen)
+        await analytics.record_generation_finished("error")
         return await bot.send_message(chat_id, messages.INSUFFICIENT_CREDITS.format(credits_balance=user.credits if user else 0))
 
     # 3. Check queue limit
     is_paid = user.paid
     if not is_paid:
-        queued_item = await Generation.find_one(And(Generation.chat_id == chat_id, Generation.status == "inqueue"))
-        if queued_item:
-            gen.status = "cancelled"; gen.error = "Queue limit reached"; await gen.save()
+        if await has_queued_generation(chat_id):
+            gen.status = "cancelled"; gen.error = "Queue limit reached"; await flush(gen)
+            await analytics.record_generation_finished("cancelled")
             return await bot.send_message(chat_id, messages.QUEUE_LIMIT_REACHED)
 
+    # Fail fast, before any upstream work, if a service this job needs is down
+    needed_upstreams = ["tapsage_storage", "replicate"]
+    if gen.service == "photoshoot" and gen.generation_mode in ("manual", "automatic"):
+        needed_upstreams.append("openai")
+    try:
+        resilience.ensure_available(*needed_upstreams)
+    except CircuitOpenError as e:
+        gen.status = "error"; gen.error = f"Upstream unavailable: {e.upstream}"; await flush(gen)
+        await analytics.record_generation_finished("error")
+        return await bot.send_message(chat_id, messages.UPSTREAM_UNAVAILABLE)
+
     loading_message = None
     try:
         loading_message = await bot.send_message(chat_id, messages.PROCESSING_REQUEST)
 
-        # 4. Download image bytes
-        file_info = await bot.get_file(gen.photo_file_id)
-        file_bytes = await bot.download_file(file_info.file_path)
-
-        # --- CORRECTED LOGIC ---
-        # 5. Upload image to storage FIRST to get the URL
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp_file:
-            tmp_path = Path(tmp_file.name)
-            tmp_path.write_bytes(file_bytes)
-        input_url = await tapsage_upload(tmp_path, file_name=tmp_path.name)
-        gen.input_url = str(input_url) # Save the URL to the generation object
-        tmp_path.unlink()
-        
-        # 6. Now, generate the prompt using the obtained URL
-        final_prompt = ""
-        openai_client = OpenAIClient()
-        
-        if gen.service == "photoshoot":
-            if gen.generation_mode == "template":
-                cfg = await AppConfig.find_one(AppConfig.type == "style_templates")
-                if cfg and cfg.style_templates:
-                    for t in cfg.style_templates:
-                        if t["id"] == gen.template_id:
-                            final_prompt = t["prompt"].replace("{product_name}", "this product"); break
-            
-            elif gen.generation_mode == "manual":
-                final_prompt = await openai_client.generate_prompt_from_text(gen.description)
-
-            elif gen.generation_mode == "automatic":
-                # Now we have a valid URL in gen.input_url
-                final_prompt = await openai_client.generate_prompt_from_image_url(gen.description, str(gen.input_url))
-        
-        elif gen.service == "modeling":
-            cfg = await AppConfig.find_one(AppConfig.type == "modeling_templates")
-            templates = cfg.female_templates if gen.model_gender == "female" else cfg.male_templates
-            if cfg and templates:
-                for t in templates:
-                    if t["id"] == gen.template_id:
-                        final_prompt = t["prompt"]; break
-        
-        gen.prompt = final_prompt
-        logger.info(f"Final prompt for uid={gen.uid}: {final_prompt}")
-        # --- END OF CORRECTED LOGIC ---
+        # 4-6. Upload the image and build the prompt, overlapping them when possible.
+        # With the result cache on, the lookup runs right after the download and a hit
+        # skips the upload and the LLM call.
+        llm_prompt = gen.service == "photoshoot" and gen.generation_mode in ("manual", "automatic")
+        prompt_needs_upload = gen.service == "photoshoot" and gen.generation_mode == "automatic"
+        gate = ["cache"] if settings.RESULT_CACHE_ENABLED else []
+        runner = StageRunner(f"uid={gen.uid}")
+        runner.add("download", lambda deps: _download_input_image(gen))
+        runner.add("payload", lambda deps: generation_payloads.load(gen.uid))
+        build_prompt = lambda deps: _build_prompt(gen, deps["payload"].description, deps.get("upload"))
+        if not llm_prompt:
+            # Template prompts are a config lookup, and the cache key needs them
+            runner.add("prompt", build_prompt, after=["payload"])
+        if settings.RESULT_CACHE_ENABLED:
+            runner.add("fingerprint", lambda deps: result_cache.fingerprint(deps["download"]), after=["download"])
+            runner.add(
+                "cache", lambda deps: _lookup_cached_result(gen, deps),
+                after=["fingerprint", "payload"] if llm_prompt else ["fingerprint", "payload", "prompt"],
+            )
+        runner.add("upload", _unless_cached(lambda deps: _upload_input_image(gen, deps["download"])), after=["download", *gate])
+        if llm_prompt:
+            runner.add(
+                "prompt", _unless_cached(build_prompt),
+                after=["payload", *gate, "upload"] if prompt_needs_upload else ["payload", *gate],
+            )
+        results = await runner.run()
+        cached = results.get("cache")
+        payload = results["payload"]
+        if results["upload"] is not None:
+            gen.stage_times["uploaded"] = runner.finished_at["upload"]
+            payload.input_url = results["upload"]
+        if results["prompt"] is not None:
+            gen.stage_times["prompted"] = runner.finished_at["prompt"]
+            payload.prompt = results["prompt"]
+        await generation_payloads.save(gen.uid, input_url=payload.input_url, prompt=payload.prompt)
+        logger.info(f"Final prompt for uid={gen.uid}: {payload.prompt}")
+
+        if cached:
+            gen.cost = result_cache.hit_cost(gen.cost)
 
         # 7. Deduct credits and queue
-        user.credits -= gen.cost
-        await user.save()
+        if not await credit_ledger.debit_generation(chat_id, gen.uid, int(gen.cost)):
+            await bot.delete_message(chat_id, loading_message.message_id)
+            gen.status = "error"; gen.error = "Insufficient credits"; await flush(gen)
+            await analytics.record_generation_finished("error")
+            credits_balance = await get_user_credits(chat_id) or 0
+            return await bot.send_message(chat_id, messages.INSUFFICIENT_CREDITS.format(credits_balance=credits_balance))
         gen.is_paid_user = is_paid
-        gen.status = "inqueue"
-        await gen.save()
 
-        logger.info(f"uid={gen.uid} successfully placed in queue.")
+        if cached:
+            now = datetime.utcnow()
+            gen.status = "done"; gen.result_url = cached.result_url; gen.model_name = cached.model_name
+            gen.cached_from = cached.source_uid; gen.completed_at = now; gen.result_rehosted_at = now
+            gen.stage_times["completed"] = now
+            await flush(gen)
+            await result_cache.record_hit(cached)
+            await analytics.record_generation_finished("done", cache_hit=True)
+            logger.info(f"uid={gen.uid} served from cache (source uid={cached.source_uid}).")
+            await bot.delete_message(chat_id, loading_message.message_id)
+            await bot.send_message(chat_id, messages.RESULT_FROM_CACHE.format(cost=int(gen.cost)))
+            await deliver_result(gen)
+            await job_metrics.mark(gen, "delivered")
+            return await job_metrics.record(gen)
+
+        # The status message goes out before the job is queued, so a worker never
+        # claims it without the message id it reports progress to.
+        gen.status = "inqueue"
         await bot.delete_message(chat_id, loading_message.message_id)
-        await bot.send_message(chat_id, messages.REQUEST_QUEUED_SUCCESS)
+        loading_message = None  # already gone if sending the status message fails
+        status_message = await bot.send_message(chat_id, await _queued_message(gen))
+        gen.status_message_id = status_message.message_id
+        await flush(gen)
+        logger.info(f"uid={gen.uid} successfully placed in queue.")
 
     except Exception as e:
         logger.exception(f"Processing/Queueing failed for uid={gen.uid}: {e}")
         if loading_message: await bot.delete_message(chat_id, loading_message.message_id)
-        if 'user' in locals() and user and gen.cost:
-            user.credits += gen.cost; await user.save()
-        gen.status = "error"; gen.error = str(e); await gen.save()
-        await bot.send_message(chat_id, messages.IMAGE_GENERATION_SUBMISSION_ERROR)
+        if gen.cost:
+            await credit_ledger.refund_generation(chat_id, gen.uid, int(gen.cost))
+        gen.status = "error"; gen.error = str(e); await flush(gen)
+        await analytics.record_generation_finished("error")
+        if isinstance(e, CircuitOpenError):
+            await bot.send_message(chat_id, messages.UPSTREAM_UNAVAILABLE)
+        else:
+            await bot.send_message(chat_id, messages.IMAGE_GENERATION_SUBMISSION_ERROR)
@@ -2,10 +2,21 @@ import asyncio
 from src.config import settings
 from src.database import init_db
 from src.bot import bot
+from src.services.credit_ledger import run_reconciliation_loop
+from src.services.generation_queue import run_queue_worker
+from src.services.result_rehost import run_rehost_worker
+from src.services.archival import run_archival_loop
 
 async def main():
     # Initialize MongoDB and Beanie
     await init_db()
+    # Background jobs (references kept so the tasks aren't garbage-collected)
+    background_tasks = [
+        asyncio.create_task(run_reconciliation_loop(settings.LEDGER_RECONCILE_INTERVAL_SECONDS)),
+        asyncio.create_task(run_queue_worker()),
+        asyncio.create_task(run_rehost_worker()),
+        asyncio.create_task(run_archival_loop()),
+    ]
     # Start Telegram polling
     await bot.infinity_polling()
 
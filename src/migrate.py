@@ -0,0 +1,28 @@
+# src/migrate.py
+#
+# One-off data migrations, run against the configured database:
+#   python -m src.migrate <name>
+
+import asyncio
+import sys
+
+from src.database import init_db
+from src.services import credit_ledger, generation_payloads, referrals
+
+MIGRATIONS = {
+    "ledger_opening_balances": credit_ledger.seed_opening_balances,
+    "generation_payloads": generation_payloads.migrate,
+    "user_referrals": referrals.migrate_refs,
+}
+
+
+async def main(name: str):
+    await init_db()
+    result = await MIGRATIONS[name]()
+    print(f"{name}: {result}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        sys.exit(f"Usage: python -m src.migrate <{'|'.join(MIGRATIONS)}>")
+    asyncio.run(main(sys.argv[1]))
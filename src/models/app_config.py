@@ -26,5 +26,8 @@ class AppConfig(Document):
     # For cost calculation
     service_costs: Optional[Dict[str, Dict[str, int]]] = None
 
+    # For model routing (see src/services/model_registry.py)
+    image_models: Optional[List[Dict[str, Any]]] = None
+
     class Settings:
         name = "app_config"
\ No newline at end of file
@@ -0,0 +1,26 @@
+# src/models/callback_payload.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from typing import List
+
+from src.config import settings
+
+class CallbackPayload(Document):
+    """
+    Server-side arguments for a button whose callback data would not fit in
+    Telegram's 64 bytes. The button carries only "@<token>".
+    """
+    token: str
+    action: str
+    args: List[str] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "callback_payloads"
+        indexes = [
+            IndexModel([("token", ASCENDING)], unique=True),
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=settings.CALLBACK_PAYLOAD_TTL_DAYS * 86400),
+        ]
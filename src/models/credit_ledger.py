@@ -0,0 +1,26 @@
+# src/models/credit_ledger.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from datetime import datetime
+from uuid import UUID, uuid4
+
+class CreditLedgerEntry(Document):
+    """
+    One append-only movement of a user's credits. `key` is the idempotency key
+    (e.g. "payment:<uid>", "debit:<gen uid>"), so each event is applied once.
+    """
+    uid: UUID = Field(default_factory=uuid4)
+    chat_id: int
+    amount: int                  # positive for credits, negative for debits
+    kind: str                    # gift, payment, debit, refund, referral, opening
+    key: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "credit_ledger"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("chat_id", ASCENDING), ("created_at", DESCENDING)]),
+        ]
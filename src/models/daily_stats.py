@@ -0,0 +1,21 @@
+# src/models/daily_stats.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from typing import Any, Dict
+
+class DailyStats(Document):
+    """
+    Pre-aggregated counters for one UTC day, bumped with $inc at state transitions
+    so admin stats never scan the live collections. `counters` is nested, e.g.
+    {"signups": 3, "requests": {"photoshoot": {"template": 5}}, "status": {"done": 4}}.
+    """
+    day: str                      # "YYYY-MM-DD" (UTC)
+    counters: Dict[str, Any] = Field(default_factory=dict)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "daily_stats"
+        indexes = [IndexModel([("day", ASCENDING)], unique=True)]
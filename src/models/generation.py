@@ -1,10 +1,11 @@
 # src/models/generation.py
 
-from beanie import Document
-from pydantic import Field, HttpUrl
+from beanie import Document, PydanticObjectId
+from pydantic import BaseModel, Field, HttpUrl
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from datetime import datetime
 from uuid import UUID, uuid4
-from typing import Optional
+from typing import Dict, Optional
 
 class Generation(Document):
     """
@@ -25,17 +26,20 @@ class Generation(Document):
     # --- Fields for Template/Manual/Auto Modes ---
     template_id: Optional[str] = None
     product_name: Optional[str] = None
-    description: Optional[str] = None
+    # Short excerpt of the description for list views; the full text lives in GenerationPayload
+    summary: Optional[str] = None
     
     # --- Fields for Advanced Settings ---
     lighting_style: Optional[str] = None
     color_theme: Optional[str] = None
 
     # --- Fields for Processing & Result ---
-    input_url: Optional[HttpUrl] = None
-    prompt: Optional[str] = None
+    # (input_url and prompt live in GenerationPayload)
     model_name: str
     replicate_id: Optional[str] = None
+    submitted_at: Optional[datetime] = None
+    # The "queued" message, edited in place with progress until the result arrives
+    status_message_id: Optional[int] = None
     
     status: str # init, awaiting_mode_selection, awaiting_template_selection, etc.
     
@@ -46,5 +50,89 @@ class Generation(Document):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
 
+    # --- Fields for Multi-Node Queue Leases ---
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+
+    # --- Fields for Result Re-hosting ---
+    result_rehosted_at: Optional[datetime] = None
+    rehost_attempts: int = 0
+
+    # --- Fields for the Result Cache ---
+    input_sha256: Optional[str] = None
+    input_phash: Optional[str] = None
+    cached_from: Optional[UUID] = None
+
+    # --- Fields for Job Metrics ---
+    # Stage -> when it happened (see services.job_metrics.STAGES); written per stage with dotted $set
+    stage_times: Dict[str, datetime] = Field(default_factory=dict)
+    # LLM tokens, upload bytes and Replicate's billed seconds
+    usage: Dict[str, float] = Field(default_factory=dict)
+
+    # --- Fields for Tracing ---
+    # Set when the job is confirmed; the queue worker and the webhook continue this trace
+    trace_id: Optional[str] = None
+    traceparent: Optional[str] = None
+
+    # --- Fields for Retention ---
+    # Set while the conversation is still a draft; MongoDB's TTL monitor deletes it after this
+    expires_at: Optional[datetime] = None
+
+    class Settings:
+        name = "generations"
+        # Lets handlers write only the fields they changed (see services.unit_of_work)
+        use_state_management = True
+        indexes = [
+            IndexModel([("uid", ASCENDING)]),
+            IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+            IndexModel([("replicate_id", ASCENDING)]),
+            # _id breaks created_at ties in the history pages' keyset
+            IndexModel([("chat_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel([("model_name", ASCENDING), ("status", ASCENDING), ("completed_at", DESCENDING)]),
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+            IndexModel([("status", ASCENDING), ("is_paid_user", ASCENDING), ("created_at", ASCENDING)]),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class ArchivedGeneration(Generation):
+    """
+    A terminal generation moved out of the hot collection by the archival job.
+    """
+    archived_at: Optional[datetime] = None
+
     class Settings:
-        name = "generations"
\ No newline at end of file
+        name = "generations_archive"
+        indexes = [
+            IndexModel([("uid", ASCENDING)]),
+            IndexModel([("chat_id", ASCENDING), ("created_at", DESCENDING)]),
+        ]
+
+
+class GenerationHistoryView(BaseModel):
+    """
+    Projection for the project history list: no prompt, no URL validation.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    uid: UUID
+    status: str
+    service: Optional[str] = None
+    is_paid_user: bool = False
+    product_name: Optional[str] = None
+    summary: Optional[str] = None
+    result_url: Optional[str] = None
+    created_at: datetime
+
+
+class GenerationRef(BaseModel):
+    """
+    Projection with just enough to finish and deliver a generation from a webhook.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    uid: UUID
+    chat_id: int
+    status: str
+    status_message_id: Optional[int] = None
+    result_url: Optional[str] = None
+    error: Optional[str] = None
@@ -0,0 +1,28 @@
+# src/models/generation_metric.py
+
+from beanie import Document, Granularity, TimeSeriesConfig
+from pydantic import Field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from src.config import settings
+
+class GenerationMetric(Document):
+    """
+    One point per finished generation in a time-series collection: how long each stage
+    took and what it consumed upstream, tagged with service/mode/model/tier for grouping.
+    """
+    ts: datetime
+    meta: Dict[str, Any] = Field(default_factory=dict)      # service, mode, model_name, tier, status, cached
+    cost: Optional[float] = None
+    since_confirm: Dict[str, float] = Field(default_factory=dict)   # stage -> seconds after confirmation
+    usage: Dict[str, float] = Field(default_factory=dict)
+
+    class Settings:
+        name = "generation_metrics"
+        timeseries = TimeSeriesConfig(
+            time_field="ts",
+            meta_field="meta",
+            granularity=Granularity.minutes,
+            expire_after_seconds=settings.GENERATION_METRICS_TTL_DAYS * 86400,
+        )
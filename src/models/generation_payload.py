@@ -0,0 +1,39 @@
+# src/models/generation_payload.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+from uuid import UUID
+from typing import Optional
+
+class GenerationPayload(Document):
+    """
+    The bulky text of a generation, kept out of the hot `generations` documents that
+    list and status queries scan. Loaded only where it is actually needed.
+    """
+    uid: UUID                    # same as Generation.uid
+    description: Optional[str] = None
+    prompt: Optional[str] = None
+    input_url: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Mirrors Generation.expires_at: set while the generation is a draft, cleared on confirm
+    expires_at: Optional[datetime] = None
+
+    class Settings:
+        name = "generation_payloads"
+        indexes = [
+            IndexModel([("uid", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class ArchivedGenerationPayload(GenerationPayload):
+    """
+    The payload of an archived generation, moved alongside it by the archival job.
+    """
+    archived_at: Optional[datetime] = None
+
+    class Settings:
+        name = "generation_payloads_archive"
+        indexes = [IndexModel([("uid", ASCENDING)], unique=True)]
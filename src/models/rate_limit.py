@@ -0,0 +1,24 @@
+# src/models/rate_limit.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime
+
+from src.config import settings
+
+class RateLimitBucket(Document):
+    """
+    A token bucket shared by all replicas, keyed "<scope>:<chat_id>". Refill and take
+    happen in one atomic pipeline update; idle buckets are full again and expire.
+    """
+    key: str
+    tokens: float
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "rate_limit_buckets"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=settings.RATE_LIMIT_BUCKET_TTL_SECONDS),
+        ]
@@ -0,0 +1,24 @@
+# src/models/referral.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from datetime import datetime
+from typing import Optional
+
+class Referral(Document):
+    """
+    One successful referral. A user can be referred only once, which the unique
+    index on `referred_chat_id` enforces.
+    """
+    referrer_chat_id: int
+    referred_chat_id: int
+    reward: Optional[int] = None          # None for referrals migrated from User.refs
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "referrals"
+        indexes = [
+            IndexModel([("referred_chat_id", ASCENDING)], unique=True),
+            IndexModel([("referrer_chat_id", ASCENDING), ("created_at", DESCENDING)]),
+        ]
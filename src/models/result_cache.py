@@ -0,0 +1,33 @@
+# src/models/result_cache.py
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from datetime import datetime
+from uuid import UUID
+
+from src.config import settings
+
+class ResultCacheEntry(Document):
+    """
+    A finished, re-hosted result that can be reused for an identical request by the
+    same user. `key` covers the chat and the exact input bytes; `prompt_key` covers
+    prompt, model and parameters only, for near-duplicate lookups by perceptual hash.
+    """
+    chat_id: int
+    key: str
+    prompt_key: str
+    input_phash: str
+    model_name: str
+    result_url: str
+    source_uid: UUID
+    hits: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "result_cache"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("chat_id", ASCENDING), ("prompt_key", ASCENDING), ("created_at", DESCENDING)]),
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=settings.RESULT_CACHE_TTL_DAYS * 86400),
+        ]
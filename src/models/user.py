@@ -1,10 +1,11 @@
 # src/models/user.py
 
 from beanie import Document
-from pydantic import Field
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
 from uuid import UUID, uuid4
-from typing import List, Optional
+from typing import Optional
 from src.config import settings
 
 class User(Document):
@@ -22,10 +23,19 @@ class User(Document):
     
     referred_by: Optional[int] = None 
     is_active: bool = False
-    refs: List[int] = Field(default_factory=list)
+    # Referrals live in the `referrals` collection; this is their count, kept with $inc
+    ref_count: int = 0
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
-        name = "users"
\ No newline at end of file
+        name = "users"
+        indexes = [IndexModel([("chat_id", ASCENDING)])]
+
+
+class UserBalanceView(BaseModel):
+    """
+    Projection for reads that only need the balance.
+    """
+    credits: int
@@ -0,0 +1,159 @@
+# src/router.py
+
+import base64
+import inspect
+import logging
+import secrets
+from uuid import UUID
+
+from telebot.types import CallbackQuery, Message
+
+from src.bot import bot
+from src.models.callback_payload import CallbackPayload
+from src.texts import messages
+
+logger = logging.getLogger("pp_bot.router")
+
+CALLBACK_DATA_LIMIT = 64  # bytes, enforced by Telegram
+SEPARATOR = ":"
+STORED_PREFIX = "@"
+
+
+def encode_uuid(value: UUID) -> str:
+    """
+    22 URL-safe characters instead of the 36 of the canonical form.
+    """
+    return base64.urlsafe_b64encode(value.bytes).rstrip(b"=").decode()
+
+
+def decode_uuid(text: str) -> UUID:
+    # Buttons sent before the router existed carry canonical UUIDs
+    if len(text) == 36:
+        return UUID(text)
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(text + "=="))
+    except Exception as e:
+        raise ValueError(f"Invalid UUID argument: {text}") from e
+
+
+def _encode_arg(value) -> str:
+    if isinstance(value, UUID):
+        return encode_uuid(value)
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _required_args(fn) -> int:
+    """
+    Number of arguments after `call` the handler cannot do without; trailing
+    parameters with defaults (e.g. gallery's gender) may be left out.
+    """
+    params = list(inspect.signature(fn).parameters.values())[1:]
+    return sum(1 for p in params if p.default is inspect.Parameter.empty and p.kind is not p.VAR_POSITIONAL)
+
+
+def _decode_arg(arg_type, raw: str):
+    if arg_type is UUID:
+        return decode_uuid(raw)
+    if arg_type is int:
+        return int(raw)
+    return raw or None
+
+
+class Router:
+    """
+    Central dispatch for updates. Callback data is "<action>:<arg>:<arg>..." and is
+    routed with a single dict lookup on the action; reply-keyboard buttons are routed
+    by their exact text. Handlers receive their arguments already decoded.
+    """
+    def __init__(self):
+        self.callbacks: dict[str, tuple] = {}
+        self.legacy: dict[str, str] = {}
+        self.texts: dict[str, callable] = {}
+
+    def callback(self, action: str, *arg_types, legacy: str | None = None):
+        """
+        Registers `handler(call, *args)` for an action. `legacy` is the old
+        underscore-joined prefix (e.g. "select_mode"), so buttons already sitting in
+        chats keep working.
+        """
+        def decorator(fn):
+            if action in self.callbacks:
+                raise ValueError(f"Duplicate callback action: {action}")
+            self.callbacks[action] = (fn, arg_types, _required_args(fn))
+            if legacy:
+                self.legacy[legacy] = action
+            return fn
+        return decorator
+
+    def text(self, *labels: str):
+        def decorator(fn):
+            for label in labels:
+                self.texts[label] = fn
+            return fn
+        return decorator
+
+    async def pack(self, action: str, *args) -> str:
+        """
+        Builds callback data for a button. If the result would exceed Telegram's limit,
+        or an argument contains the separator, the arguments are stored server-side
+        and the button carries a short token instead, so nothing is ever truncated.
+        """
+        encoded = [_encode_arg(arg) for arg in args]
+        data = SEPARATOR.join([action, *encoded])
+        if len(data.encode("utf-8")) <= CALLBACK_DATA_LIMIT and not any(SEPARATOR in arg for arg in encoded):
+            return data
+        token = secrets.token_urlsafe(12)
+        await CallbackPayload(token=token, action=action, args=encoded).insert()
+        return STORED_PREFIX + token
+
+    async def _unpack(self, data: str) -> tuple[str | None, list[str]]:
+        if data.startswith(STORED_PREFIX):
+            stored = await CallbackPayload.find_one(CallbackPayload.token == data[len(STORED_PREFIX):])
+            return (stored.action, stored.args) if stored else (None, [])
+        if SEPARATOR in data or data in self.callbacks:
+            action, *args = data.split(SEPARATOR)
+            return action, args
+
+        # Old underscore format: the action prefix is one or two words long
+        parts = data.split("_")
+        for words in (2, 1):
+            action = self.legacy.get("_".join(parts[:words]))
+            if action:
+                rest = data.split("_", words)[words] if len(parts) > words else ""
+                _, arg_types, _ = self.callbacks[action]
+                return action, rest.split("_", max(len(arg_types) - 1, 0)) if rest else []
+        return None, []
+
+    async def dispatch_callback(self, call: CallbackQuery):
+        action, raw_args = await self._unpack(call.data or "")
+        route = self.callbacks.get(action)
+        if not route:
+            logger.warning(f"Unroutable callback data: {call.data!r}")
+            return await bot.answer_callback_query(call.id, messages.BUTTON_EXPIRED, show_alert=True)
+
+        handler, arg_types, required = route
+        try:
+            if len(raw_args) > len(arg_types):
+                raise ValueError("too many arguments")
+            if len(raw_args) < required:
+                raise ValueError("too few arguments")
+            args = [_decode_arg(arg_type, raw) for arg_type, raw in zip(arg_types, raw_args)]
+        except ValueError:
+            logger.warning(f"Malformed callback data for '{action}': {call.data!r}")
+            return await bot.answer_callback_query(call.id, messages.GENERIC_ERROR, show_alert=True)
+        await handler(call, *args)
+
+
+router = Router()
+
+
+@bot.callback_query_handler(func=lambda call: True)
+async def dispatch_callback(call: CallbackQuery):
+    await router.dispatch_callback(call)
+
+
+@bot.message_handler(content_types=["text"], func=lambda message: message.text in router.texts)
+async def dispatch_text_button(message: Message):
+    await router.texts[message.text](message)
@@ -0,0 +1,67 @@
+# src/services/admission.py
+
+import time
+
+import logfire
+from pydantic import BaseModel
+
+from src.config import settings
+from src.services import queue_estimator
+
+_depths_cache: tuple[float, dict[str, int]] | None = None
+
+
+class Admission(BaseModel):
+    admitted: bool
+    reason: str | None = None       # queue, wait or latency
+    eta_seconds: float = 0.0        # expected time to a result if the job were queued now
+
+
+def _limits(tier: str) -> tuple[int, float, float]:
+    if tier == "paid":
+        return (settings.ADMISSION_MAX_QUEUE_PAID, settings.ADMISSION_MAX_WAIT_SECONDS_PAID,
+                settings.ADMISSION_MAX_LATENCY_SECONDS_PAID)
+    return (settings.ADMISSION_MAX_QUEUE_FREE, settings.ADMISSION_MAX_WAIT_SECONDS_FREE,
+            settings.ADMISSION_MAX_LATENCY_SECONDS_FREE)
+
+
+async def _queue_depths() -> dict[str, int]:
+    """
+    Queue depths, cached briefly per process so a burst of confirmations doesn't
+    turn into a burst of counts.
+    """
+    global _depths_cache
+    if _depths_cache and time.monotonic() - _depths_cache[0] < settings.ADMISSION_CACHE_SECONDS:
+        return _depths_cache[1]
+    depths = await queue_estimator.queue_depths()
+    _depths_cache = (time.monotonic(), depths)
+    return depths
+
+
+async def check(tier: str, service: str) -> Admission:
+    """
+    Decides whether to take a new job of `tier` right now, before any upstream work.
+    Paid jobs are claimed first, so a paid job only waits behind the paid backlog while
+    a free job waits behind both. A limit of 0 turns that check off.
+    """
+    if not settings.ADMISSION_ENABLED:
+        return Admission(admitted=True)
+    max_queue, max_wait, max_latency = _limits(tier)
+    depths = await _queue_depths()
+    ahead = depths["paid"] + (depths["free"] if tier == "free" else 0)
+    capacity = await queue_estimator.capacity_for(tier, service)
+    if capacity.jobs_per_min > 0:
+        eta = ahead * 60 / capacity.jobs_per_min + capacity.avg_seconds
+    else:
+        eta = float("inf")
+
+    reason = None
+    if max_queue and ahead >= max_queue:
+        reason = "queue"
+    elif max_wait and eta > max_wait:
+        reason = "wait"
+    elif max_latency and capacity.avg_seconds > max_latency:
+        reason = "latency"
+    if reason:
+        logfire.warn(f"🚦 Deferring {tier}/{service} job: {reason} (ahead={ahead}, eta={eta:.0f}s)")
+    return Admission(admitted=reason is None, reason=reason, eta_seconds=eta)
@@ -0,0 +1,185 @@
+# src/services/analytics.py
+
+from datetime import datetime, timedelta
+
+import logfire
+
+from src.database import secondary_reads
+from src.models.credit_ledger import CreditLedgerEntry
+from src.models.daily_stats import DailyStats
+from src.models.generation import Generation
+from src.models.payment import Payment
+from src.models.user import User
+
+
+def day_key(ts: datetime | None = None) -> str:
+    return (ts or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+async def bump(counters: dict[str, int], ts: datetime | None = None):
+    """
+    Increments counters (dotted paths under `counters`) on the day's rollup document.
+    Stats must never break a user flow, so failures are only logged.
+    """
+    try:
+        await DailyStats.get_motor_collection().update_one(
+            {"day": day_key(ts)},
+            {
+                "$inc": {f"counters.{name}": value for name, value in counters.items()},
+                "$set": {"updated_at": datetime.utcnow()},
+            },
+            upsert=True,
+        )
+    except Exception:
+        logfire.exception(f"💥 Failed to bump daily stats {counters}")
+
+
+async def record_signup():
+    await bump({"signups": 1})
+
+
+async def record_referral():
+    await bump({"referrals": 1})
+
+
+async def record_payment(amount: int, coins: int):
+    await bump({"payments": 1, "revenue": amount, "coins_sold": coins})
+
+
+async def record_generation_requested(gen: Generation):
+    await bump({f"requests.{gen.service or 'unknown'}.{gen.generation_mode or 'template'}": 1})
+
+
+async def record_admission_deferred(tier: str, reason: str):
+    await bump({f"deferred.{tier}.{reason}": 1})
+
+
+async def record_generation_finished(status: str, cache_hit: bool = False):
+    """
+    Outcome (done, error, cancelled) of a confirmed request. Counted once per request,
+    at whichever transition ends it.
+    """
+    counters = {f"status.{status}": 1}
+    if cache_hit:
+        counters["cache_hits"] = 1
+    await bump(counters)
+
+
+async def get_recent_stats(days: int = 7) -> list[DailyStats]:
+    """
+    The last `days` rollup documents, newest first: a bounded read on the unique day index.
+    """
+    today = datetime.utcnow()
+    keys = [day_key(today - timedelta(days=i)) for i in range(days)]
+    cursor = secondary_reads(DailyStats).find({"day": {"$in": keys}})
+    docs = {d["day"]: DailyStats.model_validate(d) async for d in cursor}
+    return [docs.get(key) or DailyStats(day=key) for key in keys]
+
+
+async def _group_by_day(collection, match: dict, date_field: str, fields: dict) -> dict[str, dict]:
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}}, **fields}},
+    ]
+    return {row.pop("_id"): row async for row in collection.aggregate(pipeline)}
+
+
+# Counters backfill can recompute from the source collections, with their empty value
+BACKFILLED_COUNTERS = {
+    "signups": 0, "referrals": 0, "payments": 0, "revenue": 0, "coins_sold": 0,
+    "requests": {}, "status": {}, "cache_hits": 0,
+}
+
+
+async def backfill(days: int) -> int:
+    """
+    Recomputes the last `days` rollups from the source collections, replacing the
+    counters listed in BACKFILLED_COUNTERS. Meant for the first deployment or after a counting bug; increments that
+    land while it runs may be overwritten for the affected days. The scans read from
+    secondaries when available, away from the credit updates on the primary.
+    """
+    since = datetime.strptime(day_key(datetime.utcnow() - timedelta(days=days - 1)), "%Y-%m-%d")
+    rollups: dict[str, dict] = {}
+
+    def put(day: str, path: str, value: int):
+        node = rollups.setdefault(day, {})
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = node.get(leaf, 0) + value
+
+    signups = await _group_by_day(
+        secondary_reads(User), {"created_at": {"$gte": since}}, "created_at", {"n": {"$sum": 1}}
+    )
+    for day, row in signups.items():
+        put(day, "signups", row["n"])
+
+    referrals = await _group_by_day(
+        secondary_reads(CreditLedgerEntry), {"kind": "referral", "created_at": {"$gte": since}},
+        "created_at", {"n": {"$sum": 1}},
+    )
+    for day, row in referrals.items():
+        put(day, "referrals", row["n"])
+
+    payments = await _group_by_day(
+        secondary_reads(Payment), {"status": "completed", "completed_at": {"$gte": since}}, "completed_at",
+        {"n": {"$sum": 1}, "revenue": {"$sum": "$amount"}, "coins": {"$sum": "$package_coins"}},
+    )
+    for day, row in payments.items():
+        put(day, "payments", row["n"]); put(day, "revenue", row["revenue"]); put(day, "coins_sold", row["coins"])
+
+    # Requests are generations that got priced, i.e. were confirmed and reached process_generation_request.
+    # Live counting happens on confirm, so they are bucketed by the confirm day where it is known.
+    generations = secondary_reads(Generation)
+    pipeline = [
+        {"$match": {
+            "cost": {"$ne": None},
+            "$or": [{"created_at": {"$gte": since}}, {"stage_times.confirmed": {"$gte": since}}],
+        }},
+        {"$project": {
+            "service": 1, "generation_mode": 1,
+            "at": {"$ifNull": ["$stage_times.confirmed", "$created_at"]},
+        }},
+        {"$match": {"at": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$at"}},
+                "service": {"$ifNull": ["$service", "unknown"]},
+                "mode": {"$ifNull": ["$generation_mode", "template"]},
+            },
+            "n": {"$sum": 1},
+        }},
+    ]
+    async for row in generations.aggregate(pipeline):
+        key = row["_id"]
+        put(key["day"], f"requests.{key['service']}.{key['mode']}", row["n"])
+
+    pipeline = [
+        {"$match": {"status": {"$in": ["done", "error", "cancelled"]}, "cost": {"$ne": None}}},
+        {"$project": {"status": 1, "cached_from": 1, "at": {"$ifNull": ["$completed_at", "$updated_at"]}}},
+        {"$match": {"at": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$at"}},
+                "status": "$status",
+                "cached": {"$ne": [{"$ifNull": ["$cached_from", None]}, None]},
+            },
+            "n": {"$sum": 1},
+        }},
+    ]
+    async for row in generations.aggregate(pipeline):
+        key = row["_id"]
+        put(key["day"], f"status.{key['status']}", row["n"])
+        if key["cached"]:
+            put(key["day"], "cache_hits", row["n"])
+
+    # Only the counters recomputed above are replaced; live-only ones (e.g. deferred) are kept
+    collection = DailyStats.get_motor_collection()
+    now = datetime.utcnow()
+    for i in range(days):
+        day = day_key(since + timedelta(days=i))
+        counters = rollups.get(day, {})
+        update = {f"counters.{name}": counters.get(name, empty) for name, empty in BACKFILLED_COUNTERS.items()}
+        await collection.update_one({"day": day}, {"$set": {**update, "updated_at": now}}, upsert=True)
+    logfire.info(f"📊 Backfilled {days} days of stats")
+    return days
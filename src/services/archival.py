@@ -0,0 +1,100 @@
+# src/services/archival.py
+
+import asyncio
+from datetime import datetime, timedelta
+
+import logfire
+from pymongo.errors import BulkWriteError
+
+from src.config import settings
+from src.models.generation import ArchivedGeneration, Generation
+from src.models.generation_payload import ArchivedGenerationPayload, GenerationPayload
+
+DRAFT_STATUSES = [
+    "init", "awaiting_mode_selection", "awaiting_model_gender", "awaiting_template_selection",
+    "awaiting_description", "awaiting_product_name", "awaiting_confirmation",
+]
+TERMINAL_STATUSES = ["done", "error", "cancelled"]
+
+
+async def expire_legacy_drafts() -> int:
+    """
+    Drafts created before `expires_at` existed never match the TTL index. Stamps the
+    stale ones and their payloads so the TTL monitor removes them too.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=settings.DRAFT_GENERATION_TTL_HOURS)
+    hot = Generation.get_motor_collection()
+    stale = {"status": {"$in": DRAFT_STATUSES}, "created_at": {"$lt": cutoff}, "expires_at": None}
+    uids = [doc["uid"] for doc in await hot.find(stale, {"uid": 1}).to_list(length=None)]
+    if not uids:
+        return 0
+
+    now = datetime.utcnow()
+    await GenerationPayload.get_motor_collection().update_many(
+        {"uid": {"$in": uids}}, {"$set": {"expires_at": now}}
+    )
+    result = await hot.update_many({**stale, "uid": {"$in": uids}}, {"$set": {"expires_at": now}})
+    return result.modified_count
+
+
+async def _copy_ignoring_archived(collection, docs: list[dict]):
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Only duplicate keys (already archived by an earlier, interrupted run) are expected
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+async def archive_batch(cutoff: datetime) -> int:
+    """
+    Moves one batch of old terminal generations and their payloads to the archive: copy
+    first, then delete. A crash in between is safe, since re-copying an archived _id is
+    a no-op and payloads are deleted before the generations that point at them.
+    """
+    hot = Generation.get_motor_collection()
+    docs = await hot.find(
+        {"status": {"$in": TERMINAL_STATUSES}, "created_at": {"$lt": cutoff}}
+    ).limit(settings.ARCHIVE_BATCH_SIZE).to_list(length=settings.ARCHIVE_BATCH_SIZE)
+    if not docs:
+        return 0
+
+    now = datetime.utcnow()
+    for doc in docs:
+        doc["archived_at"] = now
+    await _copy_ignoring_archived(ArchivedGeneration.get_motor_collection(), docs)
+
+    uids = [doc["uid"] for doc in docs]
+    payload_hot = GenerationPayload.get_motor_collection()
+    payloads = await payload_hot.find({"uid": {"$in": uids}}).to_list(length=len(uids))
+    if payloads:
+        for payload in payloads:
+            payload["archived_at"] = now
+        await _copy_ignoring_archived(ArchivedGenerationPayload.get_motor_collection(), payloads)
+        await payload_hot.delete_many({"uid": {"$in": uids}})
+
+    await hot.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+    return len(docs)
+
+
+async def run_archival():
+    cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    expired = await expire_legacy_drafts()
+    archived = 0
+    while True:
+        moved = await archive_batch(cutoff)
+        archived += moved
+        if moved < settings.ARCHIVE_BATCH_SIZE:
+            break
+        await asyncio.sleep(1)  # leave room for live traffic between batches
+    if expired or archived:
+        logfire.info(f"🗄 Archived {archived} generations, expired {expired} legacy drafts")
+
+
+async def run_archival_loop():
+    while True:
+        try:
+            await run_archival()
+        except Exception:
+            logfire.exception("💥 Generation archival failed")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
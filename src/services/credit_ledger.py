@@ -0,0 +1,158 @@
+# src/services/credit_ledger.py
+
+import asyncio
+from datetime import datetime
+from uuid import UUID
+
+import logfire
+from beanie.odm.utils.dump import get_dict
+from pymongo.errors import DuplicateKeyError
+
+from src.database import majority_writes
+from src.models.credit_ledger import CreditLedgerEntry
+from src.models.user import User
+
+
+async def _append(chat_id: int, amount: int, kind: str, key: str) -> CreditLedgerEntry | None:
+    """
+    Inserts a ledger entry with a majority write concern. Returns None if an entry with
+    the same key already exists.
+    """
+    entry = CreditLedgerEntry(chat_id=chat_id, amount=amount, kind=kind, key=key)
+    try:
+        result = await majority_writes(CreditLedgerEntry).insert_one(get_dict(entry, to_db=True))
+        entry.id = result.inserted_id
+    except DuplicateKeyError:
+        logfire.info(f"↩️ Ledger entry already applied: {key}")
+        return None
+    return entry
+
+
+async def apply_credit(chat_id: int, amount: int, kind: str, key: str, mark_paid: bool = False) -> bool:
+    """
+    Records a credit movement and applies it to the user's balance with an atomic $inc.
+    Returns True only the first time a given `key` is applied.
+    """
+    entry = await _append(chat_id, amount, kind, key)
+    if not entry:
+        return False
+
+    update = {"$inc": {"credits": amount}, "$set": {"updated_at": datetime.utcnow()}}
+    if mark_paid:
+        update["$set"]["paid"] = True
+    await majority_writes(User).update_one({"chat_id": chat_id}, update)
+    logfire.info(f"💰 Ledger {kind} {amount:+d} for chat_id={chat_id} ({key})")
+    return True
+
+
+async def debit_generation(chat_id: int, gen_uid: UUID, cost: int) -> bool:
+    """
+    Charges a generation once. Returns False if the user's balance is too low;
+    a generation that was already charged counts as charged.
+    """
+    key = f"debit:{gen_uid}"
+    entry = await _append(chat_id, -cost, "debit", key)
+    if not entry:
+        return True
+
+    result = await majority_writes(User).update_one(
+        {"chat_id": chat_id, "credits": {"$gte": cost}},
+        {"$inc": {"credits": -cost}, "$set": {"updated_at": datetime.utcnow()}},
+    )
+    if result.modified_count == 0:
+        await majority_writes(CreditLedgerEntry).delete_one({"_id": entry.id})
+        return False
+    logfire.info(f"💸 Ledger debit -{cost} for chat_id={chat_id} ({key})")
+    return True
+
+
+async def refund_generation(chat_id: int, gen_uid: UUID, cost: int) -> bool:
+    """
+    Refunds a generation's debit once. Does nothing if the generation was never charged.
+    """
+    debit = await CreditLedgerEntry.find_one(CreditLedgerEntry.key == f"debit:{gen_uid}")
+    if not debit:
+        return False
+    return await apply_credit(chat_id, cost, "refund", f"refund:{gen_uid}")
+
+
+async def get_recent_entries(chat_id: int, limit: int = 20) -> list[CreditLedgerEntry]:
+    return await CreditLedgerEntry.find(
+        CreditLedgerEntry.chat_id == chat_id
+    ).sort(-CreditLedgerEntry.created_at).limit(limit).to_list()
+
+
+async def get_ledger_total(chat_id: int) -> int:
+    pipeline = [
+        {"$match": {"chat_id": chat_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}},
+    ]
+    rows = await CreditLedgerEntry.get_motor_collection().aggregate(pipeline).to_list(length=1)
+    return rows[0]["total"] if rows else 0
+
+
+async def find_balance_mismatches(limit: int = 100, after_id=None) -> list[dict]:
+    """
+    Compares every user's `credits` with the sum of their ledger entries in a single
+    aggregation and returns the users whose balance does not match, in `_id` order.
+    Pass the last row's `_id` as `after_id` to page through all of them.
+    """
+    pipeline = [
+        {"$match": {"_id": {"$gt": after_id}} if after_id is not None else {}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 1, "chat_id": 1, "credits": 1}},
+        {"$lookup": {
+            "from": CreditLedgerEntry.Settings.name,
+            "let": {"cid": "$chat_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$chat_id", "$$cid"]}}},
+                {"$group": {"_id": None, "total": {"$sum": "$amount"}}},
+            ],
+            "as": "ledger",
+        }},
+        {"$project": {
+            "_id": 1,
+            "chat_id": 1,
+            "credits": 1,
+            "ledger_total": {"$ifNull": [{"$arrayElemAt": ["$ledger.total", 0]}, 0]},
+        }},
+        {"$match": {"$expr": {"$ne": ["$credits", "$ledger_total"]}}},
+        {"$limit": limit},
+    ]
+    return await User.get_motor_collection().aggregate(pipeline).to_list(length=limit)
+
+
+async def seed_opening_balances(batch_size: int = 500) -> int:
+    """
+    One-off migration: records an "opening" entry for users whose balance predates
+    the ledger, so reconciliation starts from zero mismatches. Returns entries written.
+    Pages by `_id`, so users whose opening entry already exists (and who still
+    mismatch) do not stop the run before later users are reached.
+    """
+    written = 0
+    after_id = None
+    while True:
+        mismatches = await find_balance_mismatches(limit=batch_size, after_id=after_id)
+        for row in mismatches:
+            amount = row["credits"] - row["ledger_total"]
+            if await _append(row["chat_id"], amount, "opening", f"opening:{row['chat_id']}"):
+                written += 1
+        if len(mismatches) < batch_size:
+            return written
+        after_id = mismatches[-1]["_id"]
+
+
+async def run_reconciliation_loop(interval_seconds: int):
+    """
+    Periodically checks balances against the ledger and reports mismatches.
+    """
+    while True:
+        try:
+            mismatches = await find_balance_mismatches()
+            if mismatches:
+                logfire.warn(f"⚠️ Ledger reconciliation found {len(mismatches)} mismatched balances: {mismatches}")
+            else:
+                logfire.info("✅ Ledger reconciliation: all balances match.")
+        except Exception:
+            logfire.exception("💥 Ledger reconciliation failed")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,28 @@
+# src/services/fast_reads.py
+#
+# Raw-Motor lookups for the hottest reads. They skip Beanie/pydantic entirely and
+# fetch only the fields they return; see benchmarks/bench_read_models.py.
+
+from src.models.generation import Generation
+from src.models.user import User
+
+
+async def get_user_credits(chat_id: int) -> int | None:
+    doc = await User.get_motor_collection().find_one(
+        {"chat_id": chat_id}, {"_id": 0, "credits": 1}
+    )
+    return doc["credits"] if doc else None
+
+
+async def is_paid_user(chat_id: int) -> bool:
+    doc = await User.get_motor_collection().find_one(
+        {"chat_id": chat_id}, {"_id": 0, "paid": 1}
+    )
+    return bool(doc and doc.get("paid"))
+
+
+async def has_queued_generation(chat_id: int) -> bool:
+    doc = await Generation.get_motor_collection().find_one(
+        {"chat_id": chat_id, "status": "inqueue"}, {"_id": 1}
+    )
+    return doc is not None
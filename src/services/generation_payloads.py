@@ -0,0 +1,103 @@
+# src/services/generation_payloads.py
+
+from datetime import datetime
+from uuid import UUID
+
+import logfire
+from bson import Binary
+from pymongo import UpdateOne
+
+from src.models.generation import Generation
+from src.models.generation_payload import GenerationPayload
+
+PAYLOAD_FIELDS = ("description", "prompt", "input_url")
+SUMMARY_LENGTH = 60
+
+
+def summarize(text: str | None) -> str | None:
+    """
+    Short excerpt kept on the hot document so list views never need the payload.
+    """
+    if not text:
+        return None
+    text = text.replace('\\n', ' ').replace('\\"', '"')
+    return text if len(text) <= SUMMARY_LENGTH else text[:SUMMARY_LENGTH] + "..."
+
+
+async def load(uid: UUID) -> GenerationPayload:
+    """
+    Loads a generation's payload. Documents not yet migrated still carry the fields
+    inline, so those are read from the generation itself.
+    """
+    payload = await GenerationPayload.find_one(GenerationPayload.uid == uid)
+    if payload:
+        return payload
+    legacy = await Generation.get_motor_collection().find_one(
+        {"uid": Binary.from_uuid(uid)}, {field: 1 for field in PAYLOAD_FIELDS}
+    ) or {}
+    return GenerationPayload(uid=uid, **{field: legacy.get(field) for field in PAYLOAD_FIELDS})
+
+
+async def save(uid: UUID, expires_at: datetime | None = None, **fields):
+    """
+    Partial upsert of payload fields, e.g. save(gen.uid, prompt=...). Drafts pass their
+    `expires_at` so the payload expires together with the generation.
+    """
+    unknown = set(fields) - set(PAYLOAD_FIELDS)
+    if unknown:
+        raise ValueError(f"Not payload fields: {unknown}")
+    update = {**fields, "updated_at": datetime.utcnow()}
+    if expires_at:
+        update["expires_at"] = expires_at
+    await GenerationPayload.get_motor_collection().update_one(
+        {"uid": Binary.from_uuid(uid)}, {"$set": update}, upsert=True,
+    )
+
+
+async def keep(uid: UUID):
+    """
+    Clears the draft expiry once the generation is confirmed.
+    """
+    await GenerationPayload.get_motor_collection().update_one(
+        {"uid": Binary.from_uuid(uid), "expires_at": {"$ne": None}}, {"$set": {"expires_at": None}},
+    )
+
+
+async def migrate(batch_size: int = 500) -> int:
+    """
+    One-off migration: moves inline payload fields of existing generations to the side
+    collection in batches and strips them from the hot documents. Payloads written by
+    the new code are never overwritten. Safe to re-run. Returns generations migrated.
+    """
+    hot = Generation.get_motor_collection()
+    cold = GenerationPayload.get_motor_collection()
+    legacy = {"$or": [{field: {"$exists": True}} for field in PAYLOAD_FIELDS]}
+    migrated = 0
+    while True:
+        docs = await hot.find(
+            legacy, {"uid": 1, "summary": 1, **{field: 1 for field in PAYLOAD_FIELDS}}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+
+        now = datetime.utcnow()
+        await cold.bulk_write([
+            UpdateOne(
+                {"uid": doc["uid"]},
+                {"$setOnInsert": {**{field: doc.get(field) for field in PAYLOAD_FIELDS}, "updated_at": now}},
+                upsert=True,
+            )
+            for doc in docs
+        ], ordered=False)
+
+        hot_ops = []
+        for doc in docs:
+            update = {"$unset": {field: "" for field in PAYLOAD_FIELDS}}
+            if not doc.get("summary") and doc.get("description"):
+                update["$set"] = {"summary": summarize(doc["description"])}
+            hot_ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        await hot.bulk_write(hot_ops, ordered=False)
+
+        migrated += len(docs)
+        logfire.info(f"🧊 Moved payloads of {migrated} generations to cold storage")
+    return migrated
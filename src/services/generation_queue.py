@@ -0,0 +1,283 @@
+# src/services/generation_queue.py
+
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import logfire
+from pymongo import ReturnDocument
+
+from src.bot import bot
+from src.config import settings
+from src.models.generation import Generation
+from src.services import (
+    analytics, credit_ledger, generation_payloads, job_metrics, model_registry, progress, resilience, tracing,
+)
+from src.services.replicate_client import ReplicateClient
+from src.services.result_delivery import apply_prediction
+from src.texts import messages
+
+# Identifies this replica as the owner of the leases it takes
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+
+PENDING_STATUSES = ["inqueue", "processing"]
+
+# Jobs this replica is running. The event loop only keeps weak references to tasks.
+_running: set[asyncio.Task] = set()
+
+
+def _collection():
+    return Generation.get_motor_collection()
+
+
+def _lease_free(now: datetime) -> dict:
+    return {"$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]}
+
+
+async def claim(query: dict, sort: list, attempts_field: str = "attempts") -> Generation | None:
+    """
+    Atomically takes a lease on the first generation matching `query` that nobody
+    else holds, counting the claim in `attempts_field`. Shared by every background
+    job that works on generations.
+    """
+    now = datetime.utcnow()
+    doc = await _collection().find_one_and_update(
+        {**query, **_lease_free(now)},
+        {
+            "$set": {"lease_owner": WORKER_ID, "lease_expires_at": now + timedelta(seconds=settings.LEASE_SECONDS)},
+            "$inc": {attempts_field: 1},
+        },
+        sort=sort,
+        return_document=ReturnDocument.AFTER,
+    )
+    return Generation.model_validate(doc) if doc else None
+
+
+async def claim_generation(statuses: list[str] = PENDING_STATUSES) -> Generation | None:
+    """
+    Claims the next queued job (paid users first, oldest first) or a processing job
+    whose lease has expired.
+    """
+    return await claim({"status": {"$in": statuses}}, sort=[("is_paid_user", -1), ("created_at", 1)])
+
+
+async def renew_lease(gen: Generation, seconds: int | None = None) -> bool:
+    """
+    Extends our lease. Returns False if another replica has taken it over.
+    """
+    expires = datetime.utcnow() + timedelta(seconds=seconds or settings.LEASE_SECONDS)
+    result = await _collection().update_one(
+        {"_id": gen.id, "lease_owner": WORKER_ID},
+        {"$set": {"lease_expires_at": expires}},
+    )
+    return result.modified_count == 1
+
+
+async def release_lease(gen: Generation, fields: dict | None = None, hold_seconds: int | None = None) -> bool:
+    """
+    Writes `fields` and gives up the lease, but only if we still own it.
+    With `hold_seconds`, nobody may take the job over until that much time has passed.
+    """
+    now = datetime.utcnow()
+    update = dict(fields or {})
+    update["updated_at"] = now
+    update["lease_owner"] = None
+    update["lease_expires_at"] = now + timedelta(seconds=hold_seconds) if hold_seconds else None
+    result = await _collection().update_one(
+        {"_id": gen.id, "lease_owner": WORKER_ID},
+        {"$set": update},
+    )
+    if result.modified_count == 0:
+        logfire.warn(f"⚠️ Lost lease on uid={gen.uid} before release")
+        return False
+    for field, value in (fields or {}).items():
+        if "." not in field:  # dotted paths (e.g. stage_times.x) only go to the database
+            setattr(gen, field, value)
+    return True
+
+
+def spawn(tasks: set[asyncio.Task], coro, slots: asyncio.Semaphore) -> asyncio.Task:
+    """
+    Runs a job holding one of `slots`. `tasks` keeps it referenced until it is done.
+    """
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+
+    def _done(finished: asyncio.Task):
+        tasks.discard(finished)
+        slots.release()
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def cancel_all(tasks: set[asyncio.Task]):
+    """
+    Cancels in-flight jobs on shutdown and waits for them to give their leases back.
+    """
+    for task in list(tasks):
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@asynccontextmanager
+async def lease_heartbeat(gen: Generation):
+    """
+    Keeps renewing the lease while the body runs, so slow upstream calls are not
+    mistaken for a dead replica.
+    """
+    async def _beat():
+        while True:
+            await asyncio.sleep(settings.LEASE_SECONDS / 3)
+            if not await renew_lease(gen):
+                logfire.warn(f"⚠️ Heartbeat lost lease on uid={gen.uid}")
+                return
+
+    task = asyncio.create_task(_beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+async def cancel_if_queued(gen: Generation) -> bool:
+    """
+    Cancels a queued generation unless a worker holds a live lease on it. A backoff
+    hold (no owner, future `lease_expires_at`) does not block the cancel.
+    """
+    now = datetime.utcnow()
+    result = await _collection().update_one(
+        {
+            "_id": gen.id,
+            "status": "inqueue",
+            "$or": [{"lease_owner": None}, {"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}],
+        },
+        {"$set": {"status": "cancelled", "updated_at": now, "lease_owner": None, "lease_expires_at": None}},
+    )
+    return result.modified_count == 1
+
+
+async def _fail_permanently(gen: Generation, reason: str):
+    now = datetime.utcnow()
+    if await release_lease(gen, {"status": "error", "error": reason, "completed_at": now, "stage_times.completed": now}):
+        if gen.cost:
+            await credit_ledger.refund_generation(gen.chat_id, gen.uid, int(gen.cost))
+        await analytics.record_generation_finished("error")
+        await job_metrics.record(gen)
+        await progress.finish(gen, messages.PROGRESS_FAILED)
+        await bot.send_message(gen.chat_id, messages.GENERATION_FAILED_REFUNDED)
+
+
+def _processing_hold() -> int:
+    """
+    How long a submitted job is left alone before a replica polls it: until the webhook
+    is due, or a short poll interval when no webhook is configured.
+    """
+    return settings.PROCESSING_LEASE_SECONDS if settings.REPLICATE_CALLBACK_URL else settings.REPLICATE_POLL_SECONDS
+
+
+async def _submit(gen: Generation, replicate: ReplicateClient):
+    model = await model_registry.route(gen)
+    if not model:
+        # Every eligible model is at its concurrency cap; put the job back for a moment
+        return await release_lease(gen, {"attempts": gen.attempts - 1}, hold_seconds=settings.LEASE_SECONDS // 4)
+
+    async with lease_heartbeat(gen):
+        payload = await generation_payloads.load(gen.uid)
+        try:
+            submitted_at = datetime.utcnow()
+            prediction = await replicate.create_prediction(
+                gen.chat_id, payload.prompt, payload.input_url, model=model,
+                wait_seconds=settings.REPLICATE_SYNC_WAIT_SECONDS, traceparent=gen.traceparent,
+            )
+        except Exception:
+            model_registry.record_submit_failure(model.name)
+            raise
+    # Hold the job until the webhook is due; after that another replica may poll it.
+    released = await release_lease(
+        gen,
+        {
+            "status": "processing", "replicate_id": prediction.get("id"), "model_name": model.name,
+            "submitted_at": submitted_at, "stage_times.submitted": submitted_at,
+        },
+        hold_seconds=_processing_hold(),
+    )
+    status = prediction.get("status")
+    if released and status in ("succeeded", "failed", "canceled"):
+        # Finished within the sync wait. The webhook for the same prediction becomes a no-op.
+        await apply_prediction(gen, status, prediction.get("output"), prediction.get("error"), prediction=prediction)
+    elif released:
+        progress.report(gen.chat_id, gen.status_message_id, progress.prediction_text(prediction) or messages.PROGRESS_SUBMITTED)
+
+
+async def _check_stale_processing(gen: Generation, replicate: ReplicateClient):
+    if not gen.replicate_id:
+        # Submission never got recorded; treat it as still queued.
+        return await _submit(gen, replicate)
+
+    prediction = await replicate.get_prediction(gen.replicate_id)
+    status = prediction.get("status")
+    if status in ("succeeded", "failed", "canceled"):
+        await apply_prediction(gen, status, prediction.get("output"), prediction.get("error"), prediction=prediction)
+    else:
+        # Still running upstream: checking on it shouldn't use up an attempt
+        progress.report_prediction(gen, prediction)
+        await release_lease(gen, {"attempts": gen.attempts - 1}, hold_seconds=_processing_hold())
+
+
+async def process_claimed(gen: Generation, replicate: ReplicateClient):
+    """
+    Runs one leased generation: submits queued jobs and checks on stale processing ones.
+    """
+    with tracing.resume(gen.traceparent, "queue {status} uid={uid}", status=gen.status, uid=str(gen.uid), attempt=gen.attempts):
+        await _process_claimed(gen, replicate)
+
+
+async def _process_claimed(gen: Generation, replicate: ReplicateClient):
+    if gen.attempts > settings.MAX_GENERATION_ATTEMPTS:
+        return await _fail_permanently(gen, "Max attempts exceeded")
+    try:
+        if gen.status == "inqueue":
+            await _submit(gen, replicate)
+        else:
+            await _check_stale_processing(gen, replicate)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job straight back instead of leaving it leased
+        await release_lease(gen, {"attempts": gen.attempts - 1})
+        raise
+    except Exception as e:
+        logfire.exception(f"💥 Queue worker failed on uid={gen.uid}, will retry")
+        # Back off before another replica (or we) retry it
+        await release_lease(gen, {"error": str(e)}, hold_seconds=settings.LEASE_SECONDS * gen.attempts)
+
+
+async def run_queue_worker():
+    """
+    Claims and processes generations with at most QUEUE_CONCURRENCY in flight.
+    Safe to run on every replica at once.
+    """
+    replicate = ReplicateClient()
+    slots = asyncio.Semaphore(settings.QUEUE_CONCURRENCY)
+    logfire.info(f"🏁 Queue worker started: {WORKER_ID}")
+    try:
+        while True:
+            if not resilience.is_available("replicate"):
+                # Leave jobs queued rather than burning their attempts on an open breaker
+                await asyncio.sleep(settings.QUEUE_POLL_INTERVAL_SECONDS)
+                continue
+            await slots.acquire()
+            try:
+                gen = await claim_generation()
+            except Exception:
+                logfire.exception("💥 Failed to claim a generation")
+                gen = None
+            if not gen:
+                slots.release()
+                await asyncio.sleep(settings.QUEUE_POLL_INTERVAL_SECONDS)
+                continue
+            spawn(_running, process_claimed(gen, replicate), slots)
+    finally:
+        await cancel_all(_running)
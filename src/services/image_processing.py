@@ -0,0 +1,149 @@
+# src/services/image_processing.py
+
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import logfire
+from PIL import Image, ImageOps
+
+from src.config import settings
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Shared process pool for CPU-bound image work, created on first use.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _executor
+
+
+def pick_photo_size(photo_sizes: list, target: int, min_side: int = 0):
+    """
+    Telegram sends each photo in several sizes, smallest first. Returns the smallest
+    size whose long side meets `target` and short side meets `min_side`, or the
+    largest one if none does.
+    """
+    for size in photo_sizes:
+        if max(size.width, size.height) >= target and min(size.width, size.height) >= min_side:
+            return size
+    return photo_sizes[-1]
+
+
+def read_dimensions(data: bytes) -> tuple[int, int]:
+    """
+    Reads width and height from the image header without decoding pixel data,
+    and rejects images that are too small, too large or not images at all.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    except Exception as e:
+        raise ValueError(f"Unreadable input image: {e}")
+
+    if max(width, height) > settings.INPUT_MAX_DIMENSION:
+        raise ValueError(f"Input image too large: {width}x{height}")
+    if min(width, height) < settings.INPUT_MIN_DIMENSION:
+        raise ValueError(f"Input image too small: {width}x{height}")
+    return width, height
+
+
+def reencode_jpeg(data: bytes, target: int, max_bytes: int) -> bytes:
+    """
+    Downscales the image so its long side is at most `target` and re-encodes it as
+    JPEG, lowering quality step by step until it fits in `max_bytes`. If even the
+    lowest quality is too big, keeps shrinking the image; raises ValueError once it
+    would drop below INPUT_MIN_DIMENSION.
+    Runs inside the process pool.
+    """
+    def encode(image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    with Image.open(io.BytesIO(data)) as img:
+        # For JPEG sources, draft() lets the decoder skip straight to a reduced scale.
+        img.draft("RGB", (target, target))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        img.thumbnail((target, target), Image.LANCZOS)
+
+        for quality in (90, 85, 80, 70, 60):
+            output = encode(img, quality)
+            if len(output) <= max_bytes:
+                return output
+
+        while True:
+            size = (int(img.width * 0.75), int(img.height * 0.75))
+            if min(size) < settings.INPUT_MIN_DIMENSION:
+                raise ValueError(f"Input image does not fit in {max_bytes} bytes")
+            img = img.resize(size, Image.LANCZOS)
+            output = encode(img, 60)
+            if len(output) <= max_bytes:
+                return output
+
+
+async def preprocess_input_image(data: bytes) -> bytes:
+    """
+    Validates the downloaded input photo and re-encodes it to a size-capped JPEG
+    off the event loop.
+    """
+    width, height = read_dimensions(data)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        get_executor(), reencode_jpeg, data, settings.INPUT_TARGET_RESOLUTION, settings.INPUT_MAX_BYTES
+    )
+    logfire.info(f"🖼 Preprocessed input {width}x{height}: {len(data)} -> {len(result)} bytes")
+    return result
+
+
+def encode_preview(data: bytes, max_side: int, quality: int, fmt: str) -> bytes:
+    """
+    Transcodes a generated result to a high-quality JPEG/WebP preview that Telegram
+    can send as a photo without recompressing a multi-megabyte PNG.
+    Runs inside the process pool.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt == "WEBP":
+            img.save(buffer, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+
+async def make_result_preview(data: bytes) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), encode_preview, data,
+        settings.RESULT_PREVIEW_MAX_SIDE, settings.RESULT_PREVIEW_QUALITY, settings.RESULT_PREVIEW_FORMAT.upper()
+    )
+
+
+def perceptual_hash(data: bytes) -> str:
+    """
+    64-bit difference hash as 16 hex characters. Re-encoded or slightly resized copies
+    of the same photo land within a few bits of each other.
+    Runs inside the process pool.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (64, 64))
+        img = ImageOps.exif_transpose(img).convert("L").resize((9, 8), Image.LANCZOS)
+        pixels = list(img.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+async def compute_perceptual_hash(data: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), perceptual_hash, data)
@@ -0,0 +1,92 @@
+# src/services/job_metrics.py
+
+from datetime import datetime
+
+import logfire
+
+from src.models.generation import Generation
+from src.models.generation_metric import GenerationMetric
+
+STAGES = ("confirmed", "uploaded", "prompted", "submitted", "started", "completed", "delivered")
+
+
+def openai_usage(usage: dict | None) -> dict[str, float]:
+    usage = usage or {}
+    return {
+        "llm_prompt_tokens": usage.get("prompt_tokens", 0),
+        "llm_completion_tokens": usage.get("completion_tokens", 0),
+    }
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        # Replicate sends ISO 8601 in UTC, e.g. "2025-01-01T12:00:00.123456Z"
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def replicate_fields(prediction: dict | None) -> dict:
+    """
+    Dotted-path updates for the started stage and the prediction's billed `metrics`,
+    to merge into the generation's completion update.
+    """
+    if not prediction:
+        return {}
+    fields = {}
+    started = _parse_time(prediction.get("started_at"))
+    if started:
+        fields["stage_times.started"] = started
+    metrics = prediction.get("metrics") or {}
+    for key in ("predict_time", "total_time"):
+        if metrics.get(key) is not None:
+            fields[f"usage.replicate_{key}"] = metrics[key]
+    return fields
+
+
+async def mark(gen, stage: str, at: datetime | None = None):
+    """
+    Stamps one stage on a generation that another process may also be writing to.
+    """
+    await Generation.get_motor_collection().update_one(
+        {"_id": gen.id}, {"$set": {f"stage_times.{stage}": at or datetime.utcnow()}}
+    )
+
+
+async def record(gen):
+    """
+    Writes the finished generation's point to the time-series collection. Called once,
+    after the exactly-once terminal transition. Metrics must never break delivery, so
+    failures are only logged.
+    """
+    try:
+        doc = await Generation.get_motor_collection().find_one({"_id": gen.id}, {
+            "service": 1, "generation_mode": 1, "model_name": 1, "is_paid_user": 1, "status": 1,
+            "cached_from": 1, "cost": 1, "stage_times": 1, "usage": 1,
+        })
+        if not doc:
+            return
+        times = doc.get("stage_times") or {}
+        confirmed = times.get("confirmed")
+        since_confirm = {
+            stage: (times[stage] - confirmed).total_seconds()
+            for stage in STAGES if confirmed and times.get(stage)
+        }
+        await GenerationMetric(
+            ts=times.get("delivered") or times.get("completed") or datetime.utcnow(),
+            meta={
+                "service": doc.get("service"),
+                "mode": doc.get("generation_mode"),
+                "model_name": doc.get("model_name"),
+                "tier": "paid" if doc.get("is_paid_user") else "free",
+                "status": doc.get("status"),
+                "cached": doc.get("cached_from") is not None,
+            },
+            cost=doc.get("cost"),
+            since_confirm=since_confirm,
+            usage=doc.get("usage") or {},
+        ).insert()
+    except Exception:
+        logfire.exception(f"💥 Failed to record metrics for uid={gen.uid}")
@@ -0,0 +1,179 @@
+# src/services/model_registry.py
+
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import logfire
+from pydantic import BaseModel, Field
+
+from src.config import settings
+from src.models.app_config import AppConfig
+from src.models.generation import Generation
+
+
+class ImageModel(BaseModel):
+    """
+    One Replicate image model and how to call it. Order in the registry is priority:
+    the first eligible, healthy model with spare capacity gets the job.
+    """
+    name: str
+    services: List[str] = Field(default_factory=lambda: ["photoshoot", "modeling"])
+    tiers: List[str] = Field(default_factory=lambda: ["free", "paid"])
+    max_concurrency: int = 8
+    cost_usd: float = 0.0
+    # Maps our logical inputs ("prompt", "input_image") to the model's parameter names
+    input_mapping: Dict[str, str] = Field(default_factory=lambda: {"prompt": "prompt", "input_image": "input_image"})
+    static_input: Dict[str, Any] = Field(default_factory=dict)
+    # Extra parameters sent only when there is an input image
+    image_input_extras: Dict[str, Any] = Field(default_factory=dict)
+
+    def build_input(self, prompt: str, input_url: str | None) -> dict:
+        payload_input = dict(self.static_input)
+        payload_input[self.input_mapping["prompt"]] = prompt
+        if input_url:
+            payload_input[self.input_mapping["input_image"]] = input_url
+            payload_input.update(self.image_input_extras)
+        return payload_input
+
+
+class ModelProfile(BaseModel):
+    """
+    Rolling latency/failure profile of a model, computed from recent generations.
+    """
+    samples: int = 0
+    avg_seconds: Optional[float] = None
+    failure_rate: float = 0.0
+    in_flight: int = 0
+    submit_failures: int = 0
+    throughput_per_min: float = 0.0   # completions per minute over the window
+
+    @property
+    def degraded(self) -> bool:
+        if self.submit_failures >= settings.MODEL_MAX_SUBMIT_FAILURES:
+            return True
+        if self.samples < settings.MODEL_PROFILE_MIN_SAMPLES:
+            return False
+        return (self.avg_seconds or 0) > settings.MODEL_SLOW_SECONDS or self.failure_rate > settings.MODEL_MAX_FAILURE_RATE
+
+
+DEFAULT_MODELS = [
+    ImageModel(
+        name="black-forest-labs/flux-kontext-pro",
+        max_concurrency=8,
+        cost_usd=0.04,
+        static_input={"output_format": "png", "safety_tolerance": 6},
+        image_input_extras={"aspect_ratio": "match_input_image"},
+    ),
+    ImageModel(
+        name="black-forest-labs/flux-kontext-dev",
+        max_concurrency=4,
+        cost_usd=0.025,
+        static_input={"output_format": "png"},
+        image_input_extras={"aspect_ratio": "match_input_image"},
+    ),
+]
+DEFAULT_MODEL = DEFAULT_MODELS[0]
+
+_profile_cache: dict[str, tuple[float, ModelProfile]] = {}
+# Submission errors never reach the generations collection, so they are tracked per process
+_submit_failures: dict[str, deque] = defaultdict(deque)
+
+
+def record_submit_failure(model_name: str):
+    _submit_failures[model_name].append(time.monotonic())
+
+
+def _recent_submit_failures(model_name: str) -> int:
+    failures = _submit_failures[model_name]
+    cutoff = time.monotonic() - settings.MODEL_PROFILE_WINDOW_MINUTES * 60
+    while failures and failures[0] < cutoff:
+        failures.popleft()
+    return len(failures)
+
+
+async def get_models() -> list[ImageModel]:
+    """
+    Loads the registry from AppConfig(type="image_models"), falling back to the built-in list.
+    """
+    cfg = await AppConfig.find_one(AppConfig.type == "image_models")
+    if cfg and cfg.image_models:
+        return [ImageModel(**m) for m in cfg.image_models]
+    return DEFAULT_MODELS
+
+
+async def get_profile(model_name: str) -> ModelProfile:
+    """
+    Average submit-to-completion time and failure rate over the recent window, plus
+    how many jobs are running on the model right now. Cached briefly per process.
+    """
+    cached = _profile_cache.get(model_name)
+    if cached and time.monotonic() - cached[0] < settings.MODEL_PROFILE_TTL_SECONDS:
+        cached[1].submit_failures = _recent_submit_failures(model_name)
+        return cached[1]
+
+    since = datetime.utcnow() - timedelta(minutes=settings.MODEL_PROFILE_WINDOW_MINUTES)
+    collection = Generation.get_motor_collection()
+    pipeline = [
+        {"$match": {
+            "model_name": model_name,
+            "status": {"$in": ["done", "error"]},
+            "completed_at": {"$gte": since},
+            "submitted_at": {"$ne": None},
+        }},
+        {"$group": {
+            "_id": None,
+            "samples": {"$sum": 1},
+            "avg_ms": {"$avg": {"$subtract": ["$completed_at", "$submitted_at"]}},
+            "errors": {"$sum": {"$cond": [{"$eq": ["$status", "error"]}, 1, 0]}},
+        }},
+    ]
+    rows = await collection.aggregate(pipeline).to_list(length=1)
+    in_flight = await collection.count_documents({"model_name": model_name, "status": "processing"})
+
+    profile = ModelProfile(in_flight=in_flight, submit_failures=_recent_submit_failures(model_name))
+    if rows:
+        row = rows[0]
+        profile.samples = row["samples"]
+        profile.avg_seconds = row["avg_ms"] / 1000 if row["avg_ms"] is not None else None
+        profile.failure_rate = row["errors"] / row["samples"]
+        profile.throughput_per_min = row["samples"] / settings.MODEL_PROFILE_WINDOW_MINUTES
+    _profile_cache[model_name] = (time.monotonic(), profile)
+    return profile
+
+
+async def eligible_models(gen: Generation) -> list[ImageModel]:
+    """
+    Models allowed for the job's service and user tier, in priority order.
+    """
+    tier = "paid" if gen.is_paid_user else "free"
+    return [
+        m for m in await get_models()
+        if (gen.service or "photoshoot") in m.services and tier in m.tiers
+    ]
+
+
+async def route(gen: Generation) -> ImageModel | None:
+    """
+    Picks the model for a job by service and user tier, preferring the first healthy
+    model with spare capacity. If every eligible model is degraded, the least-bad one
+    with capacity is used. Returns None if all eligible models are at their cap.
+    """
+    candidates = await eligible_models(gen)
+    with_capacity = []
+    for model in candidates:
+        profile = await get_profile(model.name)
+        if profile.in_flight >= model.max_concurrency:
+            continue
+        if not profile.degraded:
+            profile.in_flight += 1  # keep the cached count honest until the next refresh
+            return model
+        with_capacity.append((profile.failure_rate, profile.avg_seconds or 0, model, profile))
+
+    if with_capacity:
+        _, _, fallback, profile = min(with_capacity, key=lambda item: (item[0], item[1]))
+        profile.in_flight += 1
+        logfire.warn(f"⚠️ All eligible models degraded, routing uid={gen.uid} to {fallback.name}")
+        return fallback
+    return None
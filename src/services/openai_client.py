@@ -6,6 +6,7 @@ import json
 import logfire
 from src.config import settings
 from src.texts import prompts
+from src.services.resilience import resilient
 
 class OpenAIClient:
     def __init__(self):
@@ -13,6 +14,8 @@ class OpenAIClient:
         self.api_key = settings.TAPSAGE_API_KEY
         self.api_url = "https://api.tapsage.com/openai/v1/chat/completions"
         self.client = httpx.AsyncClient(timeout=90.0, verify=False)
+        # `usage` of the last completion (prompt/completion tokens), for job metrics
+        self.last_usage: dict = {}
 
     async def generate_prompt_from_text(self, user_text: str) -> str:
         """
@@ -60,6 +63,7 @@ class OpenAIClient:
         }
         return await self._make_request(payload)
 
+    @resilient("openai")
     async def _make_request(self, payload: dict) -> str:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -84,10 +88,11 @@ class OpenAIClient:
             
             logfire.info(f"--- OpenAI Response ---")
             logfire.info(f"Status Code: {response.status_code}")
-            logfire.info(f"Response JSON: {response.json()}")
-
+            # Before parsing, so a non-JSON 5xx surfaces as a (retryable) HTTP error
             response.raise_for_status()
             data = response.json()
+            logfire.info(f"Response JSON: {data}")
+            self.last_usage = data.get("usage") or {}
             content = data['choices'][0]['message']['content']
             
             if "sorry" in content.lower() or "can't assist" in content.lower():
@@ -1,7 +1,10 @@
 import httpx
 from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
 import logfire
 from src.config import settings
+from src.services.resilience import resilient
 
 # Configure Logfire once with your shared token
 logfire.configure(token=settings.LOGFIRE_TOKEN)
@@ -17,6 +20,7 @@ class PixyStorage:
         # We disable SSL verification here if your environment requires it.
         self.client = httpx.AsyncClient(timeout=60.0, verify=False)
 
+    @resilient("pixy")
     async def upload(self, file_bytes: bytes, filename: str) -> str:
         """
         Uploads the given bytes under `filename` to Pixy.ir and returns the public URL.
@@ -50,6 +54,49 @@ class PixyStorage:
             logfire.exception(f"💥 Unexpected error during Pixy upload for {filename}")
             raise
 
+    async def upload_stream(self, chunks: AsyncIterator[bytes], filename: str) -> str:
+        """
+        Uploads a file from an async stream of chunks, so large files never have to
+        be held in memory. The multipart body is written by hand because httpx's
+        `files=` only accepts in-memory or sync file objects.
+        """
+        url = f"{self.base_url}{self.upload_endpoint}"
+        boundary = uuid4().hex
+        headers = {
+            "Authorization": f"Bearer {settings.PIXY_API_KEY}",
+            "Accept": "application/json",
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+        }
+
+        async def body():
+            yield (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            async for chunk in chunks:
+                yield chunk
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        logfire.info(f"⏳ Starting streamed Pixy upload: {filename}")
+        try:
+            response = await self.client.post(url, headers=headers, content=body())
+            response.raise_for_status()
+            data = response.json()
+            file_url = data.get("url")
+            if not file_url:
+                raise ValueError(f"No `url` in Pixy response: {data}")
+            logfire.info(f"✅ Pixy streamed upload succeeded: {file_url}")
+            return file_url
+
+        except httpx.HTTPStatusError as e:
+            logfire.error(f"❌ Pixy HTTP error {e.response.status_code}: {e.response.text}")
+            raise
+
+        except Exception:
+            logfire.exception(f"💥 Unexpected error during streamed Pixy upload for {filename}")
+            raise
+
     async def close(self):
         """Clean up the HTTP client."""
         await self.client.aclose()
@@ -0,0 +1,123 @@
+# src/services/progress.py
+
+import asyncio
+import re
+import time
+
+import logfire
+from telebot.apihelper import ApiTelegramException
+
+from src.bot import bot
+from src.config import settings
+from src.texts import messages
+
+# tqdm-style progress lines in Replicate logs, e.g. " 45%|████▌     | 13/28 [00:04<00:05]"
+_PERCENT_RE = re.compile(r"(\d{1,3})%\|")
+
+# Per process. Pending texts are kept per status message, so several jobs in one chat
+# never overwrite each other; the edit rate limit is per chat, as Telegram's is.
+_pending: dict[int, dict[int, str]] = {}          # chat_id -> {message_id: newest text}
+_flushers: dict[int, asyncio.Task] = {}           # chat_id -> task sending that chat's edits
+_last_edit: dict[int, float] = {}                 # chat_id -> monotonic time of the last edit
+_last_text: dict[tuple[int, int], str] = {}       # (chat_id, message_id) -> text last shown
+_in_flight: dict[int, int] = {}                   # chat_id -> message_id being edited right now
+
+
+def parse_percent(logs: str | None) -> int | None:
+    matches = _PERCENT_RE.findall(logs or "")
+    return min(int(matches[-1]), 100) if matches else None
+
+
+def prediction_text(prediction: dict) -> str | None:
+    """
+    The status line for a running Replicate prediction (from a webhook event or a poll).
+    """
+    status = prediction.get("status")
+    if status == "starting":
+        return messages.PROGRESS_STARTING
+    if status != "processing":
+        return None
+    if prediction.get("output"):
+        return messages.PROGRESS_FINISHING
+    percent = parse_percent(prediction.get("logs"))
+    if percent is None:
+        return messages.PROGRESS_RUNNING
+    return messages.PROGRESS_RUNNING_PERCENT.format(percent=percent)
+
+
+async def _flush(chat_id: int):
+    try:
+        while _pending.get(chat_id):
+            wait = _last_edit.get(chat_id, 0.0) + settings.PROGRESS_EDIT_INTERVAL_SECONDS - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            pending = _pending.get(chat_id)
+            if not pending:
+                break
+            message_id = next(iter(pending))
+            text = pending.pop(message_id)
+            if _last_text.get((chat_id, message_id)) == text:
+                continue
+            _last_edit[chat_id] = time.monotonic()
+            _last_text[(chat_id, message_id)] = text
+            _in_flight[chat_id] = message_id
+            try:
+                await bot.edit_message_text(text, chat_id, message_id)
+            except ApiTelegramException as e:
+                # "message is not modified", deleted messages and 429s just drop this update
+                logfire.info(f"✏️ Progress edit skipped for chat_id={chat_id}: {e}")
+            finally:
+                _in_flight.pop(chat_id, None)
+    finally:
+        # A cancelled flusher may already have been replaced by a newer one
+        if _flushers.get(chat_id) is asyncio.current_task():
+            del _flushers[chat_id]
+            if not _pending.get(chat_id):
+                _pending.pop(chat_id, None)
+
+
+def _start_flusher(chat_id: int):
+    if chat_id not in _flushers:
+        _flushers[chat_id] = asyncio.create_task(_flush(chat_id))
+
+
+def report(chat_id: int, message_id: int | None, text: str | None):
+    """
+    Queues an edit of a status message. Edits are coalesced: only the newest text of
+    each message is sent, and a chat gets at most one edit every
+    PROGRESS_EDIT_INTERVAL_SECONDS.
+    """
+    if not message_id or not text:
+        return
+    _pending.setdefault(chat_id, {})[message_id] = text
+    _start_flusher(chat_id)
+
+
+def report_prediction(gen, prediction: dict):
+    report(gen.chat_id, gen.status_message_id, prediction_text(prediction))
+
+
+async def finish(gen, text: str):
+    """
+    Drops pending updates of this generation's status message and shows the final
+    state right away. Other generations in the same chat keep their updates.
+    """
+    chat_id, message_id = gen.chat_id, gen.status_message_id
+    if not message_id:
+        return
+    _pending.get(chat_id, {}).pop(message_id, None)
+    _last_text.pop((chat_id, message_id), None)
+    if _in_flight.get(chat_id) == message_id:
+        # An older edit of this very message is on its way; it must not land after ours
+        flusher = _flushers.pop(chat_id, None)
+        if flusher:
+            flusher.cancel()
+        if _pending.get(chat_id):
+            _start_flusher(chat_id)
+    if chat_id not in _flushers:
+        _pending.pop(chat_id, None)
+        _last_edit.pop(chat_id, None)
+    try:
+        await bot.edit_message_text(text, chat_id, message_id)
+    except ApiTelegramException as e:
+        logfire.info(f"✏️ Final progress edit skipped for uid={gen.uid}: {e}")
@@ -0,0 +1,101 @@
+# src/services/queue_estimator.py
+
+from typing import Optional
+
+from pydantic import BaseModel
+
+from src.config import settings
+from src.models.generation import Generation
+from src.services import model_registry
+
+
+class Capacity(BaseModel):
+    """
+    Drain rate of the queue for one tier and service, from the rolling model profiles.
+    """
+    avg_seconds: float            # submit-to-completion time of one job
+    jobs_per_min: float           # how fast queued jobs are taken off the queue
+    measured_per_min: float       # completions actually observed over the window
+    concurrency: int
+
+
+class QueueEstimate(BaseModel):
+    position: int                 # 1 = next in line
+    eta_seconds: float
+
+
+async def queue_position(gen) -> int:
+    """
+    Position in the claim order (paid users first, then oldest first), counted on the
+    (status, is_paid_user, created_at) index.
+    """
+    collection = Generation.get_motor_collection()
+    ahead = await collection.count_documents({
+        "status": "inqueue", "is_paid_user": gen.is_paid_user, "created_at": {"$lt": gen.created_at},
+    })
+    if not gen.is_paid_user:
+        ahead += await collection.count_documents({"status": "inqueue", "is_paid_user": True})
+    return ahead + 1
+
+
+async def capacity_for(tier: str, service: str) -> Capacity:
+    """
+    Combines the eligible models' measured service times and throughput. The theoretical
+    rate (concurrency / service time) is used when traffic is too light for the measured
+    throughput to reflect capacity; the measured rate wins when it is higher.
+    """
+    models = [
+        m for m in await model_registry.get_models()
+        if service in m.services and tier in m.tiers
+    ]
+    concurrency = 0
+    measured = 0.0
+    weighted_seconds = 0.0
+    weight = 0
+    for model in models:
+        profile = await model_registry.get_profile(model.name)
+        concurrency += model.max_concurrency
+        measured += profile.throughput_per_min
+        if profile.avg_seconds is not None and profile.samples:
+            weighted_seconds += profile.avg_seconds * profile.samples
+            weight += profile.samples
+
+    avg_seconds = weighted_seconds / weight if weight else settings.QUEUE_DEFAULT_SERVICE_SECONDS
+    theoretical = concurrency * 60 / avg_seconds if avg_seconds else 0.0
+    return Capacity(
+        avg_seconds=avg_seconds,
+        jobs_per_min=max(measured, theoretical),
+        measured_per_min=measured,
+        concurrency=concurrency,
+    )
+
+
+async def estimate(gen) -> Optional[QueueEstimate]:
+    """
+    Position and expected wait until the result is ready, for a queued generation.
+    Works on full documents and on projections with status/tier/service/created_at.
+    """
+    if gen.status != "inqueue":
+        return None
+    position = await queue_position(gen)
+    capacity = await capacity_for("paid" if gen.is_paid_user else "free", gen.service or "photoshoot")
+    if capacity.jobs_per_min <= 0:
+        return QueueEstimate(position=position, eta_seconds=float("inf"))
+    wait = (position - 1) * 60 / capacity.jobs_per_min
+    return QueueEstimate(position=position, eta_seconds=wait + capacity.avg_seconds)
+
+
+async def queue_depths() -> dict[str, int]:
+    collection = Generation.get_motor_collection()
+    return {
+        "paid": await collection.count_documents({"status": "inqueue", "is_paid_user": True}),
+        "free": await collection.count_documents({"status": "inqueue", "is_paid_user": False}),
+        "processing": await collection.count_documents({"status": "processing"}),
+    }
+
+
+def format_eta(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "نامشخص"
+    minutes = max(1, round(seconds / 60))
+    return f"{minutes} دقیقه"
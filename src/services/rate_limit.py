@@ -0,0 +1,123 @@
+# src/services/rate_limit.py
+
+import math
+import time
+
+import logfire
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.config import settings
+from src.models.rate_limit import RateLimitBucket
+from src.services.fast_reads import is_paid_user
+
+# scope -> tier -> (burst capacity, tokens refilled per minute); RATE_LIMITS overrides entries
+DEFAULT_LIMITS: dict[str, dict[str, tuple[float, float]]] = {
+    "photo": {"free": (5, 2), "paid": (20, 10)},
+    "confirm": {"free": (3, 1), "paid": (10, 5)},
+    "payment": {"free": (5, 1), "paid": (5, 1)},
+    "verify": {"free": (6, 2), "paid": (6, 2)},
+}
+
+# Per process: buckets for the memory backend, known denials and tiers, so a user who
+# keeps hammering a limited action doesn't cost a database round-trip per tap
+_local_buckets: dict[str, tuple[float, float]] = {}
+_denied_until: dict[str, float] = {}
+_tiers: dict[int, tuple[float, str]] = {}
+_MAX_LOCAL_ENTRIES = 10_000
+
+
+def _limit(scope: str, tier: str) -> tuple[float, float]:
+    override = settings.RATE_LIMITS.get(scope, {}).get(tier)
+    capacity, per_minute = override or DEFAULT_LIMITS[scope][tier]
+    return float(capacity), per_minute / 60
+
+
+async def _tier(chat_id: int) -> str:
+    cached = _tiers.get(chat_id)
+    if cached and time.monotonic() - cached[0] < settings.RATE_LIMIT_TIER_CACHE_SECONDS:
+        return cached[1]
+    tier = "paid" if await is_paid_user(chat_id) else "free"
+    if len(_tiers) > _MAX_LOCAL_ENTRIES:
+        _tiers.clear()
+    _tiers[chat_id] = (time.monotonic(), tier)
+    return tier
+
+
+def _take_local(key: str, capacity: float, rate: float) -> tuple[bool, float]:
+    now = time.monotonic()
+    tokens, last = _local_buckets.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - last) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    if len(_local_buckets) > _MAX_LOCAL_ENTRIES:
+        # Buckets that would be full again carry no information
+        for stale in [k for k, (t, at) in _local_buckets.items() if t + (now - at) * rate >= capacity]:
+            del _local_buckets[stale]
+    _local_buckets[key] = (tokens, now)
+    return allowed, tokens
+
+
+async def _take_shared(key: str, capacity: float, rate: float) -> tuple[bool, float]:
+    """
+    Refills by the time since the last take and takes a token, in one atomic update.
+    Uses the server clock ($$NOW), so replicas with skewed clocks agree.
+    """
+    elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+    refilled = {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]}]}
+    pipeline = [
+        {"$set": {"tokens": refilled, "updated_at": "$$NOW"}},
+        {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+        {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+    ]
+    collection = RateLimitBucket.get_motor_collection()
+    for _ in range(2):
+        try:
+            doc = await collection.find_one_and_update(
+                {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            return doc["allowed"], doc["tokens"]
+        except DuplicateKeyError:
+            continue  # lost the race to create the bucket; it exists now
+    return True, capacity
+
+
+async def acquire(scope: str, chat_id: int) -> float | None:
+    """
+    Takes a token from the chat's bucket for `scope` (photo, confirm, payment, verify),
+    sized by the user's tier. Returns None if allowed, otherwise the seconds until the
+    next token. Fails open if the limiter itself errors.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    key = f"{scope}:{chat_id}"
+    now = time.monotonic()
+    denied_until = _denied_until.get(key)
+    if denied_until:
+        if now < denied_until:
+            return denied_until - now
+        del _denied_until[key]
+
+    try:
+        capacity, rate = _limit(scope, await _tier(chat_id))
+        if settings.RATE_LIMIT_BACKEND == "memory":
+            allowed, tokens = _take_local(key, capacity, rate)
+        else:
+            allowed, tokens = await _take_shared(key, capacity, rate)
+    except Exception:
+        logfire.exception(f"💥 Rate limiter failed for {key}, allowing")
+        return None
+    if allowed:
+        return None
+
+    retry_after = (1 - tokens) / rate
+    if len(_denied_until) > _MAX_LOCAL_ENTRIES:
+        _denied_until.clear()
+    _denied_until[key] = now + retry_after
+    logfire.info(f"🚦 Rate limited {key} for {retry_after:.0f}s")
+    return retry_after
+
+
+def format_wait(seconds: float) -> int:
+    return max(1, math.ceil(seconds))
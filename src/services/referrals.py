@@ -0,0 +1,85 @@
+# src/services/referrals.py
+
+from datetime import datetime
+
+import logfire
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from src.models.referral import Referral
+from src.models.user import User
+from src.services import credit_ledger
+
+
+async def reward_referral(referrer_chat_id: int, referred_chat_id: int, reward: int) -> bool:
+    """
+    Credits the referrer and records the referral. Every step is idempotent (ledger key,
+    upsert on the referred user, counter bumped only on insert), so a retry after a
+    partial failure completes the work without double rewards. Returns True only the
+    first time the reward is applied.
+    """
+    credited = await credit_ledger.apply_credit(
+        referrer_chat_id, reward, "referral", f"referral:{referred_chat_id}"
+    )
+    try:
+        result = await Referral.get_motor_collection().update_one(
+            {"referred_chat_id": referred_chat_id},
+            {"$setOnInsert": {
+                "referrer_chat_id": referrer_chat_id,
+                "reward": reward,
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+        inserted = result.upserted_id is not None
+    except DuplicateKeyError:
+        inserted = False  # a concurrent request recorded it first
+    if inserted:
+        await User.get_motor_collection().update_one(
+            {"chat_id": referrer_chat_id}, {"$inc": {"ref_count": 1}}
+        )
+    return credited
+
+
+async def migrate_refs(batch_size: int = 200) -> int:
+    """
+    One-off migration: turns each user's legacy `refs` array into Referral records,
+    sets `ref_count` from them and drops the array. Safe to re-run. Returns users migrated.
+    """
+    users = User.get_motor_collection()
+    referrals = Referral.get_motor_collection()
+    migrated = 0
+    while True:
+        docs = await users.find(
+            {"refs": {"$exists": True}}, {"chat_id": 1, "refs": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+
+        referred_ids = [ref for doc in docs for ref in doc.get("refs") or []]
+        joined_at = {
+            u["chat_id"]: u.get("created_at")
+            async for u in users.find({"chat_id": {"$in": referred_ids}}, {"chat_id": 1, "created_at": 1})
+        }
+        ops = [
+            UpdateOne(
+                {"referred_chat_id": ref},
+                {"$setOnInsert": {
+                    "referrer_chat_id": doc["chat_id"],
+                    "reward": None,
+                    "created_at": joined_at.get(ref) or datetime.utcnow(),
+                }},
+                upsert=True,
+            )
+            for doc in docs for ref in doc.get("refs") or []
+        ]
+        if ops:
+            await referrals.bulk_write(ops, ordered=False)
+
+        for doc in docs:
+            ref_count = await referrals.count_documents({"referrer_chat_id": doc["chat_id"]})
+            await users.update_one({"_id": doc["_id"]}, {"$set": {"ref_count": ref_count}, "$unset": {"refs": ""}})
+
+        migrated += len(docs)
+        logfire.info(f"👥 Migrated referral lists of {migrated} users")
+    return migrated
@@ -4,6 +4,8 @@ import httpx
 import logfire
 
 from src.config import settings
+from src.services.model_registry import DEFAULT_MODEL, ImageModel
+from src.services.resilience import resilient
 
 # Configure Logfire once with your shared token
 logfire.configure(token=settings.LOGFIRE_TOKEN)
@@ -14,7 +16,7 @@ class ReplicateClient:
     omitting `input_image` when not provided.
     """
     def __init__(self):
-        self.model = "black-forest-labs/flux-kontext-pro"
+        self.model = DEFAULT_MODEL
         self.client = httpx.AsyncClient(
             base_url="https://api.replicate.com/v1",
             headers={
@@ -24,35 +26,43 @@ class ReplicateClient:
             timeout=60.0
         )
 
-    async def submit_generation(
+    # Not idempotent: only retried when Replicate can't have created the prediction
+    @resilient("replicate", idempotent=False)
+    async def create_prediction(
         self,
         chat_id: int,
         prompt: str,
-        input_url: str | None = None
-    ) -> str:
+        input_url: str | None = None,
+        model: ImageModel | None = None,
+        wait_seconds: int = 0,
+        traceparent: str | None = None,
+    ) -> dict:
         """
-        Submits a prediction to the specified model.
+        Submits a prediction to the specified model (the registry default if omitted).
         If input_url is None, omits input_image (for text-only flows).
-        Returns the Replicate prediction ID.
+        With `wait_seconds`, Replicate holds the request open (`Prefer: wait`) and the
+        returned prediction already carries the output if it finished within that time.
+        The webhook is still registered, so slower jobs complete the usual way. Its URL
+        carries `traceparent` so the delivery joins the job's trace.
         """
-        payload_input: dict = {
-            "prompt": prompt,
-            "output_format": "png",
-            "safety_tolerance": 6,
-        }
-        if input_url:
-            payload_input["input_image"] = input_url
-            payload_input["aspect_ratio"] = "match_input_image"
-
-        payload = {
-            "input": payload_input,
-            "webhook": f"{settings.REPLICATE_CALLBACK_URL}?chat_id={chat_id}",
-        }
+        model = model or self.model
+        payload = {"input": model.build_input(prompt, input_url)}
+        if settings.REPLICATE_CALLBACK_URL:
+            payload["webhook"] = f"{settings.REPLICATE_CALLBACK_URL}?chat_id={chat_id}"
+            if traceparent:
+                payload["webhook"] += f"&traceparent={traceparent}"
+            # Intermediate events drive the live progress message
+            payload["webhook_events_filter"] = ["start", "output", "logs", "completed"]
+        headers = {}
+        timeout = self.client.timeout
+        if wait_seconds:
+            headers["Prefer"] = f"wait={wait_seconds}"
+            timeout = httpx.Timeout(wait_seconds + 30.0)
 
         logfire.info(f"🚀 Replicate payload: {payload}")
         try:
             response = await self.client.post(
-                f"/models/{self.model}/predictions", json=payload
+                f"/models/{model.name}/predictions", json=payload, headers=headers, timeout=timeout
             )
             response.raise_for_status()
         except httpx.HTTPStatusError as e:
@@ -64,6 +74,18 @@ class ReplicateClient:
             raise
 
         data = response.json()
-        pred_id = data.get("id")
-        logfire.info(f"✅ Replicate prediction created: id={pred_id}")
-        return pred_id
\ No newline at end of file
+        logfire.info(f"✅ Replicate prediction created: id={data.get('id')} status={data.get('status')}")
+        return data
+
+    @resilient("replicate")
+    async def get_prediction(self, pred_id: str) -> dict:
+        """
+        Fetches the current state of a prediction (status, output, error, metrics).
+        """
+        try:
+            response = await self.client.get(f"/predictions/{pred_id}")
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logfire.error(f"❌ Replicate HTTP {e.response.status_code} fetching {pred_id}: {e.response.text}")
+            raise
+        return response.json()
@@ -0,0 +1,204 @@
+# src/services/resilience.py
+
+import asyncio
+import functools
+import time
+
+import aiohttp
+import httpx
+import logfire
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from src.config import settings
+from src.texts import messages
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        super().__init__(messages.UPSTREAM_UNAVAILABLE)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures, fails fast while
+    open, and lets a single trial call through once `reset_seconds` have passed.
+    State is per process.
+    """
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        if self.state != "open":
+            return False
+        return time.monotonic() - self.opened_at < self.reset_seconds
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and not self.is_open:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logfire.warn(f"🔌 Circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of successful calls (plus a small burst), so a
+    struggling upstream isn't hit with a retry storm.
+    """
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class UpstreamPolicy:
+    def __init__(self, attempts: int, max_wait: float):
+        self.attempts = attempts
+        self.max_wait = max_wait
+        self.breaker = CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+        self.budget = RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_BURST)
+
+
+UPSTREAMS: dict[str, UpstreamPolicy] = {
+    "tapsage_storage": UpstreamPolicy(attempts=3, max_wait=4.0),
+    "openai": UpstreamPolicy(attempts=3, max_wait=8.0),
+    "replicate": UpstreamPolicy(attempts=3, max_wait=5.0),
+    "zarinpal": UpstreamPolicy(attempts=2, max_wait=2.0),
+    "pixy": UpstreamPolicy(attempts=3, max_wait=4.0),
+}
+
+
+def is_transient(exc: BaseException, idempotent: bool = True) -> bool:
+    """
+    Whether an error is worth retrying. For non-idempotent calls only errors where
+    the request surely never got processed qualify, to avoid duplicate side effects:
+    429/503 rejections and failures before a connection was made. A 502/504 from a
+    gateway or a dropped connection may hide a request the upstream did process.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code in (429, 503) or (idempotent and code >= 500)
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in (429, 503) or (idempotent and exc.status >= 500)
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, aiohttp.ClientConnectorError)):
+        return True
+    if isinstance(exc, (httpx.TransportError, aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return idempotent
+    return False
+
+
+def ensure_available(*upstreams: str):
+    """
+    Fails fast before starting work that needs an upstream whose breaker is open.
+    """
+    for name in upstreams:
+        if UPSTREAMS[name].breaker.is_open:
+            raise CircuitOpenError(name)
+
+
+def is_available(upstream: str) -> bool:
+    return not UPSTREAMS[upstream].breaker.is_open
+
+
+async def call(upstream: str, fn, *args, idempotent: bool = True, **kwargs):
+    """
+    Calls `fn` under the upstream's breaker, retrying transient errors with jittered
+    exponential backoff within the upstream's attempt limit and retry budget.
+    """
+    policy = UPSTREAMS[upstream]
+    breaker = policy.breaker
+    if not breaker.allow():
+        raise CircuitOpenError(upstream)
+
+    def should_retry(exc: BaseException) -> bool:
+        return is_transient(exc, idempotent) and not breaker.is_open and policy.budget.try_spend()
+
+    def log_retry(retry_state):
+        logfire.warn(
+            f"🔁 Retrying {upstream} (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}"
+        )
+
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(policy.attempts),
+        wait=wait_random_exponential(multiplier=0.5, max=policy.max_wait),
+        retry=retry_if_exception(should_retry),
+        before_sleep=log_retry,
+        reraise=True,
+    ):
+        with attempt:
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                breaker.trial_in_flight = False
+                raise
+            except Exception as e:
+                if is_transient(e, idempotent=True):
+                    breaker.record_failure()
+                else:
+                    # The upstream answered (e.g. a 4xx), so it is alive
+                    breaker.record_success()
+                raise
+            breaker.record_success()
+            policy.budget.deposit()
+            return result
+
+
+def resilient(upstream: str, idempotent: bool = True):
+    """
+    Decorator form of `call` for upstream client functions and methods.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await call(upstream, fn, *args, idempotent=idempotent, **kwargs)
+        return wrapper
+    return decorator
+
+
+def breaker_states() -> list[dict]:
+    return [
+        {
+            "upstream": name,
+            "state": "half_open" if policy.breaker.state == "open" and not policy.breaker.is_open else policy.breaker.state,
+            "failures": policy.breaker.failures,
+            "budget": policy.budget.tokens,
+        }
+        for name, policy in UPSTREAMS.items()
+    ]
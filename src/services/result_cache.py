@@ -0,0 +1,120 @@
+# src/services/result_cache.py
+
+import hashlib
+import json
+import math
+from datetime import datetime
+
+import logfire
+from beanie.operators import In
+from pymongo.errors import DuplicateKeyError
+
+from src.config import settings
+from src.models.generation import Generation
+from src.models.generation_payload import GenerationPayload
+from src.models.result_cache import ResultCacheEntry
+from src.services import generation_payloads, model_registry
+from src.services.image_processing import compute_perceptual_hash
+from src.services.model_registry import ImageModel
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _request_text(gen: Generation, payload: GenerationPayload) -> str:
+    """
+    The normalized text that decides the output. LLM-written prompts differ on every
+    call, so for manual/automatic modes the user's own description is used instead.
+    """
+    if gen.generation_mode in ("manual", "automatic"):
+        text = f"{gen.generation_mode}:{payload.description or ''}"
+    else:
+        text = payload.prompt or ""
+    return " ".join(text.lower().split())
+
+
+def prompt_key(gen: Generation, payload: GenerationPayload, model: ImageModel) -> str:
+    params = json.dumps({"static": model.static_input, "image": model.image_input_extras}, sort_keys=True)
+    return _sha256(f"{model.name}\n{params}\n{gen.service}\n{_request_text(gen, payload)}")
+
+
+def exact_key(chat_id: int, input_sha256: str, p_key: str) -> str:
+    return _sha256(f"{chat_id}\n{input_sha256}\n{p_key}")
+
+
+def phash_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def hit_cost(cost: float) -> int:
+    return math.ceil(cost * settings.RESULT_CACHE_HIT_COST_RATIO)
+
+
+async def fingerprint(data: bytes) -> tuple[str, str]:
+    """
+    Content hash and perceptual hash of the raw input photo. The perceptual hash is
+    computed in the image process pool.
+    """
+    return hashlib.sha256(data).hexdigest(), await compute_perceptual_hash(data)
+
+
+async def lookup(gen: Generation, payload: GenerationPayload) -> ResultCacheEntry | None:
+    """
+    Finds a reusable result for the generation: an exact input match first, then the
+    closest near-duplicate image with the same prompt, model and parameters. Only the
+    user's own results are considered, so nobody is served a picture made from
+    someone else's photo.
+    """
+    if not gen.input_sha256 or not _request_text(gen, payload):
+        return None
+    p_keys = [prompt_key(gen, payload, m) for m in await model_registry.eligible_models(gen)]
+    if not p_keys:
+        return None
+
+    exact = await ResultCacheEntry.find_one(
+        ResultCacheEntry.chat_id == gen.chat_id,
+        In(ResultCacheEntry.key, [exact_key(gen.chat_id, gen.input_sha256, k) for k in p_keys]),
+    )
+    if exact:
+        return exact
+
+    candidates = await ResultCacheEntry.find(
+        ResultCacheEntry.chat_id == gen.chat_id, In(ResultCacheEntry.prompt_key, p_keys)
+    ).sort(-ResultCacheEntry.created_at).limit(50).to_list()
+    best = min(candidates, key=lambda c: phash_distance(c.input_phash, gen.input_phash), default=None)
+    if best and phash_distance(best.input_phash, gen.input_phash) <= settings.RESULT_CACHE_PHASH_DISTANCE:
+        return best
+    return None
+
+
+async def record_hit(entry: ResultCacheEntry):
+    await ResultCacheEntry.get_motor_collection().update_one({"_id": entry.id}, {"$inc": {"hits": 1}})
+
+
+async def remember(gen: Generation):
+    """
+    Stores a finished, re-hosted result. Only owned-storage URLs are cached, since
+    Replicate's delivery URLs expire.
+    """
+    if not settings.RESULT_CACHE_ENABLED or not gen.input_sha256 or gen.cached_from:
+        return
+    payload = await generation_payloads.load(gen.uid)
+    model = next((m for m in await model_registry.get_models() if m.name == gen.model_name), None)
+    if not model or not _request_text(gen, payload):
+        return
+    p_key = prompt_key(gen, payload, model)
+    try:
+        await ResultCacheEntry(
+            chat_id=gen.chat_id,
+            key=exact_key(gen.chat_id, gen.input_sha256, p_key),
+            prompt_key=p_key,
+            input_phash=gen.input_phash,
+            model_name=gen.model_name,
+            result_url=str(gen.result_url),
+            source_uid=gen.uid,
+            created_at=datetime.utcnow(),
+        ).insert()
+        logfire.info(f"🗃 Cached result of uid={gen.uid}")
+    except DuplicateKeyError:
+        pass
@@ -0,0 +1,102 @@
+# src/services/result_delivery.py
+
+import io
+from datetime import datetime
+
+import httpx
+import logfire
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputFile
+
+from src.bot import bot
+from src.models.generation import Generation, GenerationRef
+from src.router import router
+from src.services import analytics, job_metrics, progress
+from src.services.image_processing import make_result_preview
+from src.texts import messages, buttons
+
+_http = httpx.AsyncClient(timeout=60.0, follow_redirects=True)
+
+
+async def download_result(url: str) -> bytes:
+    response = await _http.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+async def original_file_markup(gen: Generation | GenerationRef) -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton(buttons.ORIGINAL_FILE, callback_data=await router.pack("original", gen.uid)))
+    return markup
+
+
+async def deliver_result(gen: Generation | GenerationRef):
+    """
+    Downloads the generated output once, transcodes it to a compact preview in the
+    process pool and sends that as a photo. The lossless original stays one tap away.
+    Falls back to letting Telegram fetch the URL if anything goes wrong.
+    """
+    url = str(gen.result_url)
+    markup = await original_file_markup(gen)
+    with logfire.span("deliver result uid={uid}", uid=str(gen.uid)):
+        try:
+            original = await download_result(url)
+            preview = await make_result_preview(original)
+            logfire.info(f"📦 Result preview for uid={gen.uid}: {len(original)} -> {len(preview)} bytes")
+            await bot.send_photo(gen.chat_id, preview, reply_markup=markup)
+        except Exception:
+            logfire.exception(f"💥 Preview delivery failed for uid={gen.uid}, sending URL directly")
+            await bot.send_photo(gen.chat_id, url, reply_markup=markup)
+
+
+async def send_original_file(gen: Generation):
+    """
+    Sends the untouched output as a document. Telegram only accepts URLs for a few
+    document types, so the file is downloaded and uploaded.
+    """
+    url = str(gen.result_url)
+    data = await download_result(url)
+    last_segment = url.rsplit("/", 1)[-1]
+    extension = last_segment.rsplit(".", 1)[-1] if "." in last_segment else "png"
+    await bot.send_document(gen.chat_id, InputFile(io.BytesIO(data), file_name=f"{gen.uid}.{extension}"))
+
+
+async def apply_prediction(
+    gen: Generation | GenerationRef, status: str, output, error: str | None, prediction: dict | None = None
+) -> bool:
+    """
+    Moves a generation to its terminal state from a Replicate prediction and notifies
+    the user. The transition is conditional on the generation still being pending, so
+    a webhook and a poller seeing the same prediction deliver it only once.
+    With the full `prediction`, its start time and billed metrics are recorded too.
+    """
+    now = datetime.utcnow()
+    if status == "succeeded" and output:
+        update = {"status": "done", "result_url": output[0] if isinstance(output, list) else output}
+    elif status in ("failed", "canceled"):
+        update = {"status": "error", "error": error or "unknown error"}
+    else:
+        return False
+    update.update({"completed_at": now, "updated_at": now, "lease_owner": None, "lease_expires_at": None})
+    update.update({"stage_times.completed": now, **job_metrics.replicate_fields(prediction)})
+
+    result = await Generation.get_motor_collection().update_one(
+        {"_id": gen.id, "status": {"$in": ["inqueue", "processing"]}},
+        {"$set": update},
+    )
+    if result.modified_count == 0:
+        logfire.info(f"↩️ Prediction for uid={gen.uid} already applied, skipping delivery")
+        return False
+
+    gen.status = update["status"]
+    await analytics.record_generation_finished(gen.status)
+    if gen.status == "done":
+        gen.result_url = update["result_url"]
+        await progress.finish(gen, messages.PROGRESS_DONE)
+        await deliver_result(gen)
+        await job_metrics.mark(gen, "delivered")
+    else:
+        gen.error = update["error"]
+        await progress.finish(gen, messages.PROGRESS_FAILED)
+        await bot.send_message(gen.chat_id, messages.GENERATION_FAILED_WEBHOOK.format(error=gen.error))
+    await job_metrics.record(gen)
+    return True
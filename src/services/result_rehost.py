@@ -0,0 +1,108 @@
+# src/services/result_rehost.py
+
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import logfire
+
+from src.config import settings
+from src.models.generation import Generation
+from src.services import result_cache
+from src.services.generation_queue import cancel_all, claim, lease_heartbeat, release_lease, spawn
+from src.services.pixy_storage import PixyStorage
+from src.services.tapsage_storage import tapsage_upload
+
+CHUNK_SIZE = 256 * 1024
+
+# Transfers this replica is running. The event loop only keeps weak references to tasks.
+_running: set[asyncio.Task] = set()
+
+_http = httpx.AsyncClient(timeout=120.0, follow_redirects=True)
+
+
+def _filename(gen: Generation) -> str:
+    last_segment = str(gen.result_url).rsplit("/", 1)[-1]
+    extension = last_segment.rsplit(".", 1)[-1] if "." in last_segment else "png"
+    return f"{gen.uid}.{extension}"
+
+
+async def _rehost_to_pixy(gen: Generation, pixy: PixyStorage) -> str:
+    async with _http.stream("GET", str(gen.result_url)) as response:
+        response.raise_for_status()
+        return await pixy.upload_stream(response.aiter_bytes(CHUNK_SIZE), _filename(gen))
+
+
+async def _rehost_to_tapsage(gen: Generation) -> str:
+    # tapsage_upload reads from disk, so spool the download to a temp file chunk by chunk
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir) / _filename(gen)
+        async with _http.stream("GET", str(gen.result_url)) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+        return await tapsage_upload(tmp_path, file_name=tmp_path.name)
+
+
+async def rehost_result(gen: Generation, pixy: PixyStorage):
+    """
+    Copies one finished result from Replicate to our own storage and points
+    `result_url` at the copy. Failures are retried later with backoff.
+    """
+    try:
+        async with lease_heartbeat(gen):
+            if settings.REHOST_STORAGE == "tapsage":
+                new_url = await _rehost_to_tapsage(gen)
+            else:
+                new_url = await _rehost_to_pixy(gen, pixy)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job straight back instead of leaving it leased
+        await release_lease(gen, {"rehost_attempts": gen.rehost_attempts - 1})
+        raise
+    except Exception:
+        logfire.exception(f"💥 Re-hosting failed for uid={gen.uid} (attempt {gen.rehost_attempts})")
+        await release_lease(gen, hold_seconds=settings.REHOST_POLL_INTERVAL_SECONDS * 2 ** gen.rehost_attempts)
+        return
+
+    await release_lease(gen, {"result_url": new_url, "result_rehosted_at": datetime.utcnow()})
+    logfire.info(f"📦 Re-hosted result for uid={gen.uid}: {new_url}")
+
+    try:
+        await result_cache.remember(gen)
+    except Exception:
+        logfire.exception(f"💥 Failed to cache result of uid={gen.uid}")
+
+
+async def run_rehost_worker():
+    """
+    Re-hosts finished results with at most REHOST_CONCURRENCY transfers in flight.
+    Only results completed within Replicate's output lifetime are picked up; older
+    URLs (e.g. from before re-hosting existed) are already gone.
+    """
+    pixy = PixyStorage()
+    slots = asyncio.Semaphore(settings.REHOST_CONCURRENCY)
+    try:
+        while True:
+            await slots.acquire()
+            query = {
+                "status": "done",
+                "result_url": {"$ne": None},
+                "result_rehosted_at": None,
+                "rehost_attempts": {"$lt": settings.REHOST_MAX_ATTEMPTS},
+                "completed_at": {"$gte": datetime.utcnow() - timedelta(seconds=settings.REPLICATE_OUTPUT_TTL_SECONDS)},
+            }
+            try:
+                gen = await claim(query, sort=[("completed_at", 1)], attempts_field="rehost_attempts")
+            except Exception:
+                logfire.exception("💥 Failed to claim a generation for re-hosting")
+                gen = None
+            if not gen:
+                slots.release()
+                await asyncio.sleep(settings.REHOST_POLL_INTERVAL_SECONDS)
+                continue
+            spawn(_running, rehost_result(gen, pixy), slots)
+    finally:
+        await cancel_all(_running)
@@ -0,0 +1,59 @@
+# src/services/stage_runner.py
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Iterable
+
+import logfire
+
+StageFn = Callable[[dict], Awaitable[Any]]
+
+
+class StageRunner:
+    """
+    Runs async pipeline stages as soon as the stages they depend on have finished,
+    so independent work overlaps. Each stage receives a dict of its dependencies'
+    results. If any stage fails, the others are cancelled and the original
+    exception is raised, exactly as if the stages had run one after another.
+    """
+    def __init__(self, label: str = ""):
+        self.label = label
+        self._stages: dict[str, tuple[StageFn, tuple[str, ...]]] = {}
+        self.timings: dict[str, float] = {}
+        self.finished_at: dict[str, datetime] = {}
+
+    def add(self, name: str, fn: StageFn, after: Iterable[str] = ()):
+        after = tuple(after)
+        unknown = [dep for dep in after if dep not in self._stages]
+        if unknown:
+            # Dependencies must be added first, which also rules out cycles
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {unknown}")
+        self._stages[name] = (fn, after)
+
+    async def run(self) -> dict[str, Any]:
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            fn, after = self._stages[name]
+            deps = {dep: await tasks[dep] for dep in after}
+            start = time.perf_counter()
+            with logfire.span("stage {stage}", stage=name):
+                result = await fn(deps)
+            self.timings[name] = time.perf_counter() - start
+            self.finished_at[name] = datetime.utcnow()
+            return result
+
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(run_stage(name))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        logfire.info(f"⏱ Stages {self.label}: " + ", ".join(f"{k}={v:.2f}s" for k, v in self.timings.items()))
+        return {name: task.result() for name, task in tasks.items()}
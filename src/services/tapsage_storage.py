@@ -2,10 +2,12 @@ import aiohttp
 from pathlib import Path
 import logfire
 from src.config import settings
+from src.services.resilience import resilient
 
 # Configure Logfire once with your shared token
 logfire.configure(token=settings.LOGFIRE_TOKEN)
 
+@resilient("tapsage_storage")
 async def tapsage_upload(file_path: str | Path, file_name: str | None = None) -> str:
     """
     Uploads a local file at `file_path` to Tapsage storage and returns
@@ -0,0 +1,32 @@
+# src/services/tracing.py
+
+from contextlib import contextmanager
+
+import logfire
+from logfire.propagate import attach_context, get_context
+
+
+def current() -> tuple[str | None, str | None]:
+    """
+    The active span's trace id and W3C `traceparent`, to store on a generation so
+    later work (the queue worker, the webhook) can join the same trace.
+    Both are None when tracing isn't configured.
+    """
+    traceparent = get_context().get("traceparent")
+    if not traceparent:
+        return None, None
+    return traceparent.split("-")[1], traceparent
+
+
+@contextmanager
+def resume(traceparent: str | None, msg_template: str, **attributes):
+    """
+    Opens a span as a child of a stored `traceparent`, or as a new trace without one.
+    """
+    if not traceparent:
+        with logfire.span(msg_template, **attributes):
+            yield
+        return
+    with attach_context({"traceparent": traceparent}):
+        with logfire.span(msg_template, **attributes):
+            yield
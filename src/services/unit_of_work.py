@@ -0,0 +1,27 @@
+# src/services/unit_of_work.py
+
+from datetime import datetime
+
+from beanie import Document
+
+
+async def flush(*docs: Document):
+    """
+    Writes each document's changed fields as a single partial `$set`, bumping
+    `updated_at` whenever something changed. Handlers mutate freely and call this
+    once, instead of rewriting the whole document after every field.
+    Requires `use_state_management` on the model; documents without a saved state
+    (built from raw query results) fall back to a full save.
+    """
+    now = datetime.utcnow()
+    for doc in docs:
+        if doc.get_saved_state() is None:
+            if hasattr(doc, "updated_at"):
+                doc.updated_at = now
+            await doc.save()
+            continue
+        if not doc.is_changed:
+            continue
+        if hasattr(doc, "updated_at"):
+            doc.updated_at = now
+        await doc.save_changes()
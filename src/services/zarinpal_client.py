@@ -7,6 +7,7 @@ from uuid import uuid4
 
 from src.config import settings
 from src.texts import messages
+from src.services.resilience import CircuitOpenError, resilient
 
 # Configure Logfire once
 logfire.configure(token=settings.LOGFIRE_TOKEN)
@@ -29,6 +30,22 @@ class ZarinpalClient:
     def _headers(self):
         return {"Content-Type": "application/json", "Accept": "application/json"}
 
+    async def _post(self, url: str, payload: dict) -> httpx.Response:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            res = await client.post(url, json=payload, headers=self._headers())
+        res.raise_for_status()
+        return res
+
+    # A retried request only creates an unused authority, but keep it to safe errors anyway
+    @resilient("zarinpal", idempotent=False)
+    async def _post_request(self, payload: dict) -> httpx.Response:
+        return await self._post(self.request_url, payload)
+
+    # Verification is idempotent on Zarinpal's side (code 101 on repeats)
+    @resilient("zarinpal")
+    async def _post_verify(self, payload: dict) -> httpx.Response:
+        return await self._post(self.verify_url, payload)
+
     async def create_payment(
         self,
         chat_id: int,
@@ -53,11 +70,12 @@ class ZarinpalClient:
         logfire.info(f"🔄 Zarinpal create_payment payload: {payload}")
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                res = await client.post(self.request_url, json=payload, headers=self._headers())
-            res.raise_for_status()
+            res = await self._post_request(payload)
             resp_json = res.json()
 
+        except CircuitOpenError:
+            logfire.error("❌ Zarinpal create skipped: circuit open")
+            return {"success": False, "error": messages.UPSTREAM_UNAVAILABLE, "status": "CIRCUIT_OPEN"}
         except httpx.TimeoutException:
             msg = messages.PAYMENT_REQUEST_TIMEOUT
             logfire.error(f"❌ Zarinpal create timeout: {msg}")
@@ -97,11 +115,12 @@ class ZarinpalClient:
         logfire.info(f"🔄 Zarinpal verify_payment payload: {payload}")
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                res = await client.post(self.verify_url, json=payload, headers=self._headers())
-            res.raise_for_status()
+            res = await self._post_verify(payload)
             resp_json = res.json()
 
+        except CircuitOpenError:
+            logfire.error("❌ Zarinpal verify skipped: circuit open")
+            return {"success": False, "error": messages.UPSTREAM_UNAVAILABLE, "status": "CIRCUIT_OPEN"}
         except httpx.TimeoutException:
             msg = messages.VERIFICATION_REQUEST_TIMEOUT
             logfire.error(f"❌ Zarinpal verify timeout: {msg}")
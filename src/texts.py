@@ -3,6 +3,7 @@
 class MessageTexts:
     # --- پیام‌های عمومی ---
     GENERIC_ERROR = "متاسفانه خطایی رخ داده است. لطفا دوباره تلاش کنید."
+    BUTTON_EXPIRED = "این دکمه منقضی شده است. لطفا دوباره از منو شروع کنید."
     INVALID_CHOICE = "گزینه انتخاب شده معتبر نیست."
     PACKAGE_NOT_FOUND = "بسته انتخابی شما یافت نشد."
     UNEXPECTED_TEXT_PROMPT = "برای شروع یک پروژه جدید، لطفا ابتدا یک عکس از محصول خود را ارسال کنید. 🖼️"
@@ -70,6 +71,7 @@ class MessageTexts:
     CONFIRMATION_PROMPT_MODELING = "لطفا درخواست عکاسی مدلینگ خود را بازبینی و تایید کنید:\n\n**جنسیت مدل:** {gender}\n**قالب انتخابی:** {template_name}"
     
     REQUEST_ACCEPTED = " تایید شد."
+    REQUEST_ALREADY_ACCEPTED = "⏳ این درخواست قبلا تایید شده و در حال آماده‌سازی است."
     REQUEST_CANCELLED = "❌ درخواست لغو شد. برای شروع مجدد، لطفا تصویر جدیدی ارسال کنید."
     EDIT_PROMPT_PRODUCT_NAME = "✏️ لطفا نام جدید محصول را وارد کنید."
     EDIT_PROMPT_DESCRIPTION = "✏️ لطفا توضیحات جدید خود را وارد کنید."
@@ -78,13 +80,33 @@ class MessageTexts:
     INSUFFICIENT_CREDITS = "⚠️ اعتبار شما کافی نیست.\nموجودی فعلی: {credits_balance} سکه\nبرای خرید اعتبار از دستور /buy استفاده کنید."
     PROCESSING_REQUEST = "⏳ درخواست شما در حال پردازش است، لطفا کمی صبر کنید..."
     REQUEST_QUEUED_SUCCESS = "✅ درخواست شما با موفقیت در صف قرار گرفت و به زودی پردازش خواهد شد."
+    QUEUE_POSITION_ETA = "🔢 نوبت شما در صف: {position} | زمان تقریبی آماده شدن: {eta}"
+    PROJECT_QUEUE_ETA = "\n*نوبت: {position} | زمان تقریبی: {eta}*"
+    PROGRESS_SUBMITTED = "📤 درخواست شما برای تولید تصویر ارسال شد..."
+    PROGRESS_STARTING = "🚀 در حال آماده‌سازی مدل..."
+    PROGRESS_RUNNING = "🎨 در حال ساخت تصویر شما..."
+    PROGRESS_RUNNING_PERCENT = "🎨 در حال ساخت تصویر شما... {percent}٪"
+    PROGRESS_FINISHING = "📦 تصویر ساخته شد، در حال ارسال..."
+    PROGRESS_DONE = "✅ تصویر شما آماده شد."
+    PROGRESS_FAILED = "❌ تولید تصویر انجام نشد."
+    SYSTEM_BUSY_DEFERRED = (
+        "🚦 سرور در حال حاضر بسیار شلوغ است و زمان انتظار تقریبی {eta} است.\n"
+        "درخواست شما ذخیره شد و هیچ سکه‌ای کسر نشد. لطفا چند دقیقه دیگر دوباره آن را تایید کنید."
+    )
+    RATE_LIMITED = "⏳ کمی آهسته‌تر! درخواست‌های شما زیاد بوده است. لطفا {seconds} ثانیه دیگر دوباره تلاش کنید."
+    RESULT_FROM_CACHE = "⚡️ نتیجه‌ی مشابه این درخواست از قبل موجود بود و فورا آماده شد. هزینه: {cost} سکه"
     IMAGE_GENERATION_SUBMISSION_ERROR = "❌ در ثبت درخواست شما خطایی رخ داد. اعتبار شما بازگردانده شد. لطفا دوباره تلاش کنید."
+    INPUT_IMAGE_TOO_SMALL = "⚠️ این عکس برای پردازش خیلی کوچک است. لطفا عکسی با حداقل {min_side} پیکسل در هر ضلع ارسال کنید."
     QUEUE_LIMIT_REACHED = "شما در حال حاضر یک درخواست در صف پردازش دارید. لطفا تا تکمیل آن صبر کنید."
     REQUEST_CANCELLED_SUCCESS = "درخواست شما با موفقیت لغو شد و اعتبار آن به حساب شما بازگردانده شد."
     REQUEST_ALREADY_PROCESSED = "این درخواست قبلا پردازش شده و دیگر قابل لغو نیست."
+    GENERATION_FAILED_WEBHOOK = "❌ متاسفانه تولید تصویر شما با خطا مواجه شد.\nخطا: {error}"
+    GENERATION_FAILED_REFUNDED = "❌ متاسفانه پس از چند تلاش، تولید تصویر شما انجام نشد. اعتبار شما بازگردانده شد."
+    WEBHOOK_GENERATION_NOT_FOUND = "Generation not found"
+    UPSTREAM_UNAVAILABLE = "⚠️ یکی از سرویس‌های مورد نیاز موقتا در دسترس نیست. لطفا چند دقیقه دیگر دوباره تلاش کنید."
 
     # --- تاریخچه پروژه‌ها ---
-    MY_PROJECTS_HEADER = "لیست ۵ پروژه اخیر شما به شرح زیر است:"
+    MY_PROJECTS_HEADER = "📂 پروژه‌های شما:"
     NO_PROJECTS_FOUND = "شما هنوز هیچ پروژه‌ای ثبت نکرده‌اید. برای شروع از دکمه «پروژه جدید» استفاده کنید."
     PROJECT_STATUS_FORMAT = "{status_icon} **{description}**\n*تاریخ ثبت: {date}*"
 
@@ -99,6 +121,51 @@ class MessageTexts:
     REFERRAL_SUCCESS_NOTIFICATION = "🎉 تبریک! کاربر جدیدی با مشخصات زیر از طریق لینک شما عضو شد و **{reward_amount} سکه** به شما هدیه داده شد:\n\n- نام کاربری: @{new_user_username}\n- آیدی: `{new_user_id}`"    
     NEW_USER_GIFT = "🎉 تبریک! {gift_amount} سکه هدیه برای شروع به حساب شما اضافه شد. برای مشاهده موجودی از دستور /balance استفاده کنید."
     GALLERY_CAPTION = "قالبهای موجود"
+    SENDING_ORIGINAL_FILE = "در حال ارسال فایل اصلی..."
+    ORIGINAL_FILE_NOT_FOUND = "متاسفانه فایل اصلی این پروژه یافت نشد."
+
+    # --- دستورات ادمین ---
+    ADMIN_USAGE_LEDGER = "استفاده: /ledger <chat_id>"
+    ADMIN_USAGE_TRACE = "استفاده: /trace <uid>"
+    ADMIN_TRACE_NOT_FOUND = "پروژه‌ای با این شناسه پیدا نشد."
+    ADMIN_TRACE_HEADER = (
+        "🧵 {uid}\n"
+        "کاربر: {chat_id} | وضعیت: {status} | مدل: {model_name} | تلاش‌ها: {attempts}\n"
+        "trace_id: {trace_id}\n"
+    )
+    ADMIN_TRACE_STAGE = "{stage}: {time} (+{since_previous}s | کل {since_start}s)"
+    ADMIN_TRACE_USAGE = "\nمصرف: {usage}"
+    ADMIN_TRACE_ERROR = "\nخطا: {error}"
+    ADMIN_LEDGER_HEADER = "دفتر اعتبار کاربر {chat_id}\nموجودی: {credits} | جمع دفتر: {ledger_total}\n"
+    ADMIN_LEDGER_ENTRY = "{date} | {kind} | {amount:+d} | {key}"
+    ADMIN_LEDGER_EMPTY = "هیچ تراکنشی برای این کاربر ثبت نشده است."
+    ADMIN_RECONCILE_OK = "✅ موجودی همه کاربران با دفتر اعتبار مطابقت دارد."
+    ADMIN_RECONCILE_MISMATCHES = "⚠️ {count} کاربر با دفتر اعتبار مغایرت دارند:\n"
+    ADMIN_RECONCILE_ROW = "{chat_id}: موجودی {credits} | دفتر {ledger_total}"
+    ADMIN_BREAKER_ROW = "{icon} {upstream}: {state} | خطاهای پیاپی: {failures} | بودجه تلاش مجدد: {budget:.1f}"
+    ADMIN_STATS_HEADER = "📊 آمار {days} روز اخیر (UTC)\n"
+    ADMIN_STATS_DAY = (
+        "📅 {day}\n"
+        "عضویت: {signups} | دعوت موفق: {referrals}\n"
+        "پرداخت: {payments} | درآمد: {revenue:,} ریال | سکه فروخته‌شده: {coins_sold}\n"
+        "درخواست‌ها: {requests}\n"
+        "موفق: {done} | خطا: {error} | لغو: {cancelled} | از کش: {cache_hits}\n"
+        "تعویق به دلیل شلوغی: {deferred}"
+    )
+    ADMIN_USAGE_STATS_BACKFILL = "استفاده: /stats_backfill <days>"
+    ADMIN_STATS_BACKFILL_DONE = "✅ آمار {days} روز اخیر از نو محاسبه شد."
+    ADMIN_CAPACITY_QUEUE = "📥 صف: پولی {paid} | رایگان {free} | در حال پردازش {processing}\n"
+    ADMIN_CAPACITY_ROW = (
+        "🧮 {tier}/{service}: ظرفیت {concurrency} | میانگین زمان {avg_seconds:.0f}s | "
+        "گذردهی {jobs_per_min:.1f}/دقیقه (اندازه‌گیری‌شده {measured_per_min:.1f}) | تخلیه صف: {drain}"
+    )
+    ADMIN_DB_POOL = (
+        "🗄 استخر اتصال MongoDB (این پروسه)\n"
+        "باز: {open} | در حال استفاده: {checked_out}/{max_pool_size} (بیشینه {peak_checked_out})\n"
+        "دریافت اتصال: {checkouts} | ناموفق: {checkout_failures} | پاک‌سازی استخر: {cleared}\n"
+        "انتظار: میانگین {avg_wait_ms:.1f}ms | بیشینه {max_wait_ms:.1f}ms"
+    )
+    ADMIN_MODEL_ROW = "{state} {name}\nدر حال اجرا: {in_flight}/{max_concurrency} | میانگین زمان: {avg_seconds}s | خطا: {failure_rate} ({samples} نمونه) | خطای ارسال: {submit_failures}"
 
 class ButtonLabels:
     # --- دکمه‌های پرداخت ---
@@ -142,7 +209,10 @@ class ButtonLabels:
 
     # --- دکمه‌های تاریخچه ---
     RESEND_IMAGE = "📥 دریافت مجدد"
+    ORIGINAL_FILE = "📎 دریافت فایل اصلی (بدون فشرده‌سازی)"
     CANCEL_REQUEST = "❌ لغو درخواست"
+    HISTORY_NEWER = "⬅️ جدیدتر"
+    HISTORY_OLDER = "قدیمی‌تر ➡️"
 
 class SystemPrompts:
     MANUAL_MODE_PROMPT = "You are a precise and literal translator and prompt formatter. Your task is to take a user's description, which is in Persian, and perform two steps:\n1. Translate the user's description literally and accurately into English. Do NOT add any new creative ideas, artistic styles, lighting effects, or quality descriptors (like \"4k\", \"cinematic\", \"masterpiece\") unless the user has explicitly mentioned them. The goal is to preserve the user's original intent as closely as possible.\n2. Reformat the translated English text into a single string of keywords and phrases, separated by commas, which is suitable for an image generation model.\n\nYour entire response must be ONLY the final, comma-separated prompt string. Do not include any explanations, introductory text, or quotation marks.\n\nExample 1:\nUser's Persian input: \"یک بسته چیپس پفک روی یک میز چوبی در یک کافه دنج\"\nYour English output: \"a bag of Cheetoz puff chips, on a wooden table, in a cozy cafe\"\n\nExample 2:\nUser's Persian input: \"عکس سینمایی از یک ماشین قرمز اسپرت در شب با نورپردازی نئونی\"\nYour English output: \"cinematic photo, a red sports car, at night, with neon lighting\""
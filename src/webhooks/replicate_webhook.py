@@ -1,17 +1,17 @@
 # src/webhooks/replicate_webhook.py
 
 from fastapi import FastAPI, Request
-from datetime import datetime
-from src.models.generation import Generation
-from src.bot import bot
+from src.models.generation import Generation, GenerationRef
 from src.texts import messages
+from src.services import progress, tracing
+from src.services.result_delivery import apply_prediction
 
 app = FastAPI()
 
 @app.post("/replicate")
 async def replicate_callback(request: Request):
     """
-    Webhook endpoint for Replicate to notify when a job completes.
+    Webhook endpoint for Replicate's start/output/logs/completed events.
     It finds the user to message via the replicate_id in the payload.
     """
     payload = await request.json()
@@ -20,24 +20,16 @@ async def replicate_callback(request: Request):
     output = payload.get("output")
     error = payload.get("error")
 
-    gen = await Generation.find_one(Generation.replicate_id == rep_id)
+    gen = await Generation.find_one(Generation.replicate_id == rep_id, projection_model=GenerationRef)
     if not gen:
         return {"error": messages.WEBHOOK_GENERATION_NOT_FOUND}
 
-    chat_id = gen.chat_id
+    if status not in ("succeeded", "failed", "canceled"):
+        progress.report_prediction(gen, payload)
+        return {"ok": True}
 
-    if status == "succeeded" and output:
-        gen.status = "done" # <-- Use new status
-        gen.result_url = output[0]
-        gen.completed_at = datetime.utcnow()
-        await bot.send_photo(chat_id, gen.result_url)
-    elif status == "failed":
-        gen.status = "error" # <-- Use new status
-        gen.error = error or "unknown error"
-        gen.completed_at = datetime.utcnow()
-        await bot.send_message(chat_id, messages.GENERATION_FAILED_WEBHOOK.format(error=gen.error))
-    
-    gen.updated_at = datetime.utcnow()
-    await gen.save()
+    # Conditional transition: a queue worker polling the same prediction won't deliver twice
+    with tracing.resume(request.query_params.get("traceparent"), "webhook {status} uid={uid}", status=status, uid=str(gen.uid)):
+        await apply_prediction(gen, status, output, error, prediction=payload)
 
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}